@@ -0,0 +1,41 @@
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from dotenv import load_dotenv
+import os
+
+from .database import DATABASE_URL
+
+load_dotenv()
+
+# asyncio driver for each database backend
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def async_database_url(url: str) -> str:
+    """The same database through its asyncio driver, e.g. sqlite:/// -> sqlite+aiosqlite:///"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return url.render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+# Engine for request handlers that run on the event loop. The scheduler,
+# ingestion workers and ML code use the sync engine in app.database, which
+# does not import this module or need the async driver.
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+
+# Objects stay readable after commit; expired attributes cannot lazy-load
+# without an await
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, class_=AsyncSession, bind=async_engine
+)
+
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def dispose_async_engine():
+    """Close the async engine's pooled connections (on shutdown)"""
+    await async_engine.dispose()
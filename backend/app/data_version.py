@@ -0,0 +1,28 @@
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models import User
+
+def bump_data_version(user_id: int, db: Session):
+    """
+    Mark the user's transactions or subscriptions as changed
+
+    Runs in the caller's transaction, so the new version becomes visible
+    together with the change it stands for.
+    """
+    db.execute(
+        update(User).where(User.id == user_id).values(data_version=User.data_version + 1)
+    )
+
+def bump_notifications_version(user_id: int, db: Session):
+    """
+    Mark the user's notifications as changed; kept apart from the data
+    version so new notifications do not invalidate cached forecasts
+    """
+    db.execute(
+        update(User).where(User.id == user_id).values(notifications_version=User.notifications_version + 1)
+    )
+
+def get_data_version(user_id: int, db: Session) -> int:
+    """Current data version of a user (0 if unknown)"""
+    return db.query(User.data_version).filter(User.id == user_id).scalar() or 0
@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -27,5 +29,45 @@ def get_db():
         db.close()
 
 def init_db():
-    """Initialize database tables"""
+    """Initialize database tables and apply pending schema migrations"""
+    from app.migrations import run_migrations
+
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+def insert_or_ignore(db, model, index_elements):
+    """Dialect-specific INSERT that skips rows conflicting on `index_elements`"""
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = postgresql_insert(model)
+    else:
+        stmt = sqlite_insert(model)
+    return stmt.on_conflict_do_nothing(index_elements=index_elements)
+
+def insert_or_replace(db, model, index_elements, columns):
+    """
+    Dialect-specific INSERT that, on a conflict over `index_elements`,
+    overwrites `columns` of the existing row with the new values
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = postgresql_insert(model)
+    else:
+        stmt = sqlite_insert(model)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: stmt.excluded[column] for column in columns}
+    )
+
+def insert_or_increment(db, model, index_elements, columns):
+    """
+    Dialect-specific INSERT that, on a conflict over `index_elements`, adds
+    the new values of `columns` to the existing row instead
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = postgresql_insert(model)
+    else:
+        stmt = sqlite_insert(model)
+    table = model.__table__
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: table.c[column] + stmt.excluded[column] for column in columns}
+    )
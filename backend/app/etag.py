@@ -0,0 +1,61 @@
+import hashlib
+from datetime import date
+from typing import Optional
+from fastapi import Depends, Request, Response, status
+
+from app.auth import get_current_user
+from app.models import User
+
+# Clients may keep a copy but must revalidate it on every use
+CACHE_CONTROL = "private, no-cache"
+
+def data_etag(request: Request, user: User, version: Optional[int] = None) -> str:
+    """
+    Strong ETag for a per-user read: the user's data version (or another
+    `version`), the request path and query, and today's date (stats and
+    forecasts are relative to it)
+    """
+    if version is None:
+        version = user.data_version
+    key = f"{user.id}|{version}|{date.today().isoformat()}|{request.url.path}?{request.url.query}"
+    return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest() + '"'
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+def _conditional_response(request: Request, response: Response, etag: str) -> Optional[Response]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+async def conditional_get(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+) -> Optional[Response]:
+    """
+    Dependency for per-user read endpoints
+
+    Sets the ETag on the response and returns a 304 response when the
+    client's If-None-Match is still current, so the endpoint can return it
+    before running any query. The data version comes from the user row that
+    authentication already loaded, so this runs on the event loop without
+    any query. Returns None when the full response is needed.
+    """
+    return _conditional_response(request, response, data_etag(request, current_user))
+
+async def notifications_conditional_get(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+) -> Optional[Response]:
+    """conditional_get keyed by the user's notifications version instead of the data version"""
+    etag = data_etag(request, current_user, current_user.notifications_version)
+    return _conditional_response(request, response, etag)
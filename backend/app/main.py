@@ -10,7 +10,9 @@ if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
 from .database import init_db
-from .routers import auth, transactions, subscriptions
+from .async_database import dispose_async_engine
+from .routers import auth, transactions, subscriptions, admin
+from services.category_training import start_trainer, stop_trainer
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -42,11 +44,22 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(transactions.router)
 app.include_router(subscriptions.router)
+app.include_router(admin.router)
 
 # Initialize database on startup
 @app.on_event("startup")
 def on_startup():
     init_db()
+    # Online categorizer learns from corrections in the background
+    start_trainer()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    stop_trainer()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await dispose_async_engine()
 
 @app.get("/")
 def read_root():
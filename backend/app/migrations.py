@@ -0,0 +1,227 @@
+"""
+Schema migrations for databases created by an older version of the app.
+
+`Base.metadata.create_all` only creates missing tables; it never adds
+columns or indexes to a table that already exists. Each migration below
+brings an existing database up to the current models and is recorded in
+the schema_migrations table, so it runs once. Migrations check before they
+change anything, which also makes them no-ops on a freshly created schema.
+
+init_db() applies pending migrations on startup. To inspect or apply them
+by hand:
+
+    cd backend
+    python -m app.migrations status
+    python -m app.migrations upgrade
+"""
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, bindparam, inspect, select, text
+from sqlalchemy.orm import Session
+
+# Allow running as a script from the backend directory
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from app.database import Base, engine as default_engine
+from app.models import User, Transaction, MerchantAlias
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False)
+)
+
+MIGRATIONS = []
+
+def migration(version: int, name: str):
+    """Register a function(connection) as the migration with this version"""
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+def _add_missing_column(conn, column):
+    """ALTER TABLE ADD COLUMN for a model column the table does not have yet"""
+    table = column.table.name
+    if column.name in {c["name"] for c in inspect(conn).get_columns(table)}:
+        return False
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    for foreign_key in column.foreign_keys:
+        ddl += f" REFERENCES {foreign_key.column.table.name}({foreign_key.column.name})"
+    conn.execute(text(ddl))
+    return True
+
+def _has_unique(conn, table: str, columns) -> bool:
+    inspector = inspect(conn)
+    unique_sets = [c["column_names"] for c in inspector.get_unique_constraints(table)]
+    unique_sets += [i["column_names"] for i in inspector.get_indexes(table) if i["unique"]]
+    return list(columns) in unique_sets
+
+@migration(1, "incremental_ingest_columns")
+def add_incremental_ingest_columns(conn):
+    """
+    Columns added for deduplication, merchant resolution, incremental
+    detection and caching, plus fingerprints for rows uploaded before them
+    """
+    for column in (User.__table__.c.data_version, Transaction.__table__.c.fingerprint,
+                   Transaction.__table__.c.merchant_id, Transaction.__table__.c.group_id):
+        _add_missing_column(conn, column)
+
+    if not _has_unique(conn, "transactions", ["user_id", "fingerprint"]):
+        conn.execute(text(
+            "CREATE UNIQUE INDEX uq_transactions_user_fingerprint ON transactions (user_id, fingerprint)"
+        ))
+
+    _backfill_fingerprints(conn)
+
+def _backfill_fingerprints(conn):
+    """
+    Give rows without a fingerprint the one a re-upload would compute; a row
+    that duplicates one already fingerprinted keeps NULL, which never conflicts
+    """
+    from services.transaction_processor import transaction_fingerprint
+
+    transactions = Transaction.__table__
+    rows = conn.execute(
+        select(transactions.c.id, transactions.c.user_id, transactions.c.date,
+               transactions.c.description, transactions.c.amount)
+        .where(transactions.c.fingerprint.is_(None))
+        .order_by(transactions.c.id)
+    ).all()
+    seen = set(conn.execute(
+        select(transactions.c.user_id, transactions.c.fingerprint)
+        .where(transactions.c.fingerprint.isnot(None))
+    ).all())
+    updates = []
+    for row in rows:
+        key = (row.user_id, transaction_fingerprint(row.date, row.description, row.amount))
+        if key not in seen:
+            seen.add(key)
+            updates.append({"row_id": row.id, "new_fingerprint": key[1]})
+    if updates:
+        conn.execute(
+            transactions.update()
+            .where(transactions.c.id == bindparam("row_id"))
+            .values(fingerprint=bindparam("new_fingerprint")),
+            updates
+        )
+
+@migration(2, "backfill_monthly_rollups")
+def backfill_monthly_rollups(conn):
+    """Rebuild every user's monthly rollups from their transactions"""
+    from services.rollups import rebuild_rollups
+
+    # The session joins the migration's transaction instead of committing
+    db = Session(bind=conn)
+    try:
+        user_ids = [row[0] for row in conn.execute(select(Transaction.user_id).distinct())]
+        for user_id in user_ids:
+            rebuild_rollups(user_id, db)
+        db.flush()
+    finally:
+        db.close()
+
+@migration(3, "per_user_indexes")
+def create_per_user_indexes(conn):
+    """
+    Composite indexes led by user_id for the hot per-user queries:
+    transactions by (user_id, date), subscriptions by (user_id, status),
+    notifications by (user_id, created_at), plus the group lookups
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+@migration(4, "transaction_search_index")
+def create_transaction_search_index(conn):
+    """FTS5 index over transaction descriptions with per-user rowids, kept in sync by triggers (SQLite only)"""
+    from services.transaction_search import create_search_index
+
+    if conn.dialect.name == "sqlite":
+        create_search_index(conn)
+
+@migration(5, "rounded_amount_fingerprints")
+def round_fingerprint_amounts(conn):
+    """
+    Recompute fingerprints with amounts rounded to cents, as ingest now
+    does, so re-uploading a file matches the rows it created before
+    """
+    conn.execute(Transaction.__table__.update().values(fingerprint=None))
+    _backfill_fingerprints(conn)
+
+@migration(6, "user_group_index")
+def create_user_group_index(conn):
+    """(user_id, group_id, amount) index for the ungrouped-debits query"""
+    create_per_user_indexes(conn)
+
+@migration(7, "merchant_alias_rules_version")
+def add_merchant_alias_rules_version(conn):
+    """
+    Keyword rules version of each merchant alias; existing aliases get NULL,
+    so they are re-resolved with the current rules on their next lookup
+    """
+    _add_missing_column(conn, MerchantAlias.__table__.c.rules_version)
+
+@migration(8, "notifications_version")
+def add_notifications_version(conn):
+    """Per-user notifications version behind the notifications ETag"""
+    _add_missing_column(conn, User.__table__.c.notifications_version)
+
+def applied_versions(engine=default_engine) -> set:
+    _metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(select(schema_migrations.c.version))}
+
+def run_migrations(engine=default_engine) -> list:
+    """
+    Apply pending migrations in version order, each in its own transaction
+
+    Returns: names of the migrations that were applied
+    """
+    applied = []
+    done = applied_versions(engine)
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            # Another worker may have applied it since done was read
+            if conn.execute(select(schema_migrations.c.version).where(
+                schema_migrations.c.version == version
+            )).first():
+                continue
+            fn(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        applied.append(name)
+    return applied
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and apply schema migrations")
+    parser.add_argument("command", choices=["status", "upgrade"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        Base.metadata.create_all(bind=default_engine)
+        applied = run_migrations()
+        print(f"✅ Applied {len(applied)} migration(s)" + (f": {', '.join(applied)}" if applied else ""))
+        return
+
+    done = applied_versions()
+    for version, name, _ in MIGRATIONS:
+        print(f"{version:>4} {name:<32} {'applied' if version in done else 'pending'}")
+
+if __name__ == "__main__":
+    main()
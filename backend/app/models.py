@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -9,12 +9,16 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped on every data change
+    notifications_version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped when notifications change
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     transactions = relationship("Transaction", back_populates="user", cascade="all, delete-orphan")
     subscriptions = relationship("Subscription", back_populates="user", cascade="all, delete-orphan")
     notifications = relationship("Notification", back_populates="user", cascade="all, delete-orphan")
+    merchant_groups = relationship("MerchantGroup", back_populates="user", cascade="all, delete-orphan")
+    monthly_rollups = relationship("MonthlyRollup", cascade="all, delete-orphan")
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -26,10 +30,90 @@ class Transaction(Base):
     amount = Column(Float, nullable=False)  # Negative for debits, positive for credits
     category = Column(String, nullable=True)
     is_recurring = Column(Boolean, default=False)
+    merchant_id = Column(Integer, ForeignKey("merchants.id"), nullable=True)  # Resolved on ingest
+    group_id = Column(Integer, ForeignKey("merchant_groups.id"), nullable=True)  # Set by subscription detection
+    fingerprint = Column(String(40), nullable=True)  # SHA-1 of date|description|amount, used for dedup
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="transactions")
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "fingerprint", name="uq_transactions_user_fingerprint"),
+        # Keyset pagination walks (date, id) newest first within a user, optionally
+        # narrowed to one category or recurring flag; id is the implicit rowid suffix
+        Index("ix_transactions_user_date_id", "user_id", "date", "id"),
+        Index("ix_transactions_user_category_date_id", "user_id", "category", "date", "id"),
+        Index("ix_transactions_user_recurring_date_id", "user_id", "is_recurring", "date", "id"),
+        # Subscription detection loads a group's members by group_id
+        Index("ix_transactions_group_id", "group_id"),
+        # Grouping reads a user's ungrouped debits; led by user_id so it does
+        # not walk every user's NULL-group rows, credits included
+        Index("ix_transactions_user_group_amount", "user_id", "group_id", "amount"),
+    )
+
+class Merchant(Base):
+    """Canonical merchant shared by every description that resolves to it"""
+    __tablename__ = "merchants"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)  # e.g., "Netflix", "Uber Ride"
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MerchantAlias(Base):
+    """Maps a normalized transaction description to its merchant"""
+    __tablename__ = "merchant_aliases"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    normalized_description = Column(String, unique=True, nullable=False)
+    merchant_id = Column(Integer, ForeignKey("merchants.id"), nullable=False)
+    category = Column(String, nullable=True)  # Rule-based category of the description
+    rules_version = Column(String(40), nullable=True)  # Keyword rules merchant and category came from
+    
+    # Relationships
+    merchant = relationship("Merchant")
+
+class MerchantGroup(Base):
+    """Persisted state of one fuzzy-matched group of a user's debits"""
+    __tablename__ = "merchant_groups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String, nullable=False)  # First 30 chars of the seed description
+    description = Column(String, nullable=False)  # Description of the transaction that started the group
+    normalized_description = Column(String, nullable=False)  # New descriptions are matched against this
+    merchant_id = Column(Integer, ForeignKey("merchants.id"), nullable=True)  # Merchant of the seed description
+    subscription_id = Column(Integer, ForeignKey("subscriptions.id"), nullable=True)
+    transaction_count = Column(Integer, default=0)
+    avg_amount = Column(Float, default=0.0)
+    mean_interval = Column(Float, nullable=True)  # Days between consecutive charges
+    std_interval = Column(Float, nullable=True)
+    last_seen_date = Column(DateTime, nullable=True)
+    is_periodic = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    user = relationship("User", back_populates="merchant_groups")
+    merchant = relationship("Merchant")
+    
+    __table_args__ = (
+        Index("ix_merchant_groups_user_id", "user_id"),
+    )
+
+class MonthlyRollup(Base):
+    """Per-user, per-month transaction totals, maintained on ingest and delete"""
+    __tablename__ = "monthly_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    month = Column(String(7), nullable=False)  # "YYYY-MM"
+    debit_sum = Column(Float, nullable=False, default=0.0)  # Negative, like debit amounts
+    credit_sum = Column(Float, nullable=False, default=0.0)
+    transaction_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "month", name="uq_monthly_rollups_user_month"),
+    )
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -38,7 +122,7 @@ class Subscription(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)  # e.g., "Netflix", "Gym Membership"
     amount = Column(Float, nullable=False)
-    frequency = Column(String, nullable=False)  # "monthly", "weekly", "quarterly"
+    frequency = Column(String, nullable=False)  # "weekly", "biweekly", "monthly", "quarterly", "semiannual", "yearly" or "every_<n>_days"
     next_payment_date = Column(DateTime, nullable=True)
     last_payment_date = Column(DateTime, nullable=True)
     status = Column(String, default="active")  # "active", "cancelled"
@@ -47,6 +131,10 @@ class Subscription(Base):
     
     # Relationships
     user = relationship("User", back_populates="subscriptions")
+    
+    __table_args__ = (
+        Index("ix_subscriptions_user_status", "user_id", "status"),
+    )
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -60,3 +148,7 @@ class Notification(Base):
     
     # Relationships
     user = relationship("User", back_populates="notifications")
+    
+    __table_args__ = (
+        Index("ix_notifications_user_created_at", "user_id", "created_at"),
+    )
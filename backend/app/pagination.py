@@ -0,0 +1,24 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+    pass
+
+def encode_cursor(date: datetime, row_id: int) -> str:
+    """Opaque token for the (date, id) position of the last row on a page"""
+    payload = json.dumps([date.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """(date, id) from a token made by encode_cursor, or None for the first page"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(date), int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid pagination cursor")
@@ -0,0 +1,205 @@
+"""
+Check that the hot per-user queries are served by indexes.
+
+Builds a large synthetic SQLite database (the schema comes from create_all
+plus the migrations), runs EXPLAIN QUERY PLAN for each query the routers,
+detector, forecaster and notification service issue per user, and fails if
+any of them scans a whole table or sorts rows an index could return in order:
+
+    cd backend
+    python -m app.query_plans --users 200 --transactions-per-user 1000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import create_engine, select, func, tuple_
+
+# Allow running as a script from the backend directory
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from app.database import Base
+from app.migrations import run_migrations
+from app.models import (
+    User, Transaction, Subscription, Notification, MerchantGroup, MonthlyRollup
+)
+from services.transaction_search import search_statement
+
+CATEGORIES = ["Streaming", "Gym", "Utilities", "Food", "EMI", "Shopping", "Other"]
+
+def build_database(engine, users: int, transactions_per_user: int, seed: int = 0):
+    """Fill an empty schema with users, transactions, groups, subscriptions and notifications"""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": u, "email": f"user{u}@example.com", "hashed_password": "x", "data_version": 0}
+            for u in range(1, users + 1)
+        ])
+        conn.execute(MerchantGroup.__table__.insert(), [
+            {"id": (u - 1) * 10 + g + 1, "user_id": u, "key": f"G{g}", "description": f"G{g}",
+             "normalized_description": f"g{g}", "transaction_count": 0, "avg_amount": 0.0}
+            for u in range(1, users + 1) for g in range(10)
+        ])
+        rows = []
+        for u in range(1, users + 1):
+            for i in range(transactions_per_user):
+                rows.append({
+                    "user_id": u,
+                    "date": start + timedelta(days=rng.randrange(1500), seconds=rng.randrange(86400)),
+                    "description": f"MERCHANT {rng.randrange(300)}",
+                    "amount": round(rng.uniform(-2000, 1000), 2),
+                    "category": rng.choice(CATEGORIES),
+                    "is_recurring": rng.random() < 0.1,
+                    "group_id": (u - 1) * 10 + rng.randrange(10) + 1 if rng.random() < 0.5 else None,
+                    "fingerprint": f"{u}-{i}",
+                    "created_at": start
+                })
+            if len(rows) >= 50000:
+                conn.execute(Transaction.__table__.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(Transaction.__table__.insert(), rows)
+        conn.execute(Subscription.__table__.insert(), [
+            {"user_id": u, "name": f"Sub {s}", "amount": 199.0, "frequency": "monthly",
+             "next_payment_date": start, "status": rng.choice(["active", "cancelled"]),
+             "confidence_score": 0.9, "created_at": start}
+            for u in range(1, users + 1) for s in range(10)
+        ])
+        conn.execute(Notification.__table__.insert(), [
+            {"user_id": u, "message": "Low balance", "type": "warning", "read": False,
+             "created_at": start + timedelta(hours=n)}
+            for u in range(1, users + 1) for n in range(100)
+        ])
+
+def hot_queries(user_id: int = 1):
+    """
+    (label, statement, ordered, per_user) for each hot query; ordered
+    queries must also get their ORDER BY from the index instead of a
+    temporary b-tree, and per-user queries must search an index led by user_id
+    """
+    cutoff = datetime(2023, 1, 1)
+    return [
+        ("transactions page", select(Transaction).where(
+            Transaction.user_id == user_id,
+            tuple_(Transaction.date, Transaction.id) < tuple_(cutoff, 10 ** 9)
+        ).order_by(Transaction.date.desc(), Transaction.id.desc()).limit(101), True, True),
+        ("transactions page by category", select(Transaction).where(
+            Transaction.user_id == user_id, Transaction.category == "Food"
+        ).order_by(Transaction.date.desc(), Transaction.id.desc()).limit(101), True, True),
+        ("transactions page by recurring", select(Transaction).where(
+            Transaction.user_id == user_id, Transaction.is_recurring == True
+        ).order_by(Transaction.date.desc(), Transaction.id.desc()).limit(101), True, True),
+        ("forecast history", select(Transaction.date, Transaction.amount).where(
+            Transaction.user_id == user_id
+        ), False, True),
+        ("recent income", select(func.sum(Transaction.amount)).where(
+            Transaction.user_id == user_id, Transaction.amount > 0, Transaction.date >= cutoff
+        ), False, True),
+        ("uncategorized transactions", select(Transaction).where(
+            Transaction.user_id == user_id, Transaction.category.is_(None)
+        ), False, True),
+        ("ungrouped debits", select(Transaction.id, Transaction.description).where(
+            Transaction.user_id == user_id, Transaction.amount < 0, Transaction.group_id.is_(None)
+        ).order_by(Transaction.id), False, True),
+        ("group members", select(Transaction.group_id, Transaction.date, Transaction.amount).where(
+            Transaction.group_id.in_([1, 2, 3])
+        ), False, False),
+        ("merchant groups", select(MerchantGroup).where(
+            MerchantGroup.user_id == user_id
+        ).order_by(MerchantGroup.id), False, True),
+        ("active subscriptions", select(Subscription).where(
+            Subscription.user_id == user_id, Subscription.status == "active"
+        ), False, True),
+        ("latest notifications", select(Notification).where(
+            Notification.user_id == user_id
+        ).order_by(Notification.created_at.desc()).limit(50), True, True),
+        ("monthly rollups", select(MonthlyRollup).where(
+            MonthlyRollup.user_id == user_id
+        ), False, True),
+        ("description search", search_statement(
+            user_id, "merchant 12", [Transaction.id, Transaction.date, Transaction.description]
+        ), False, True),
+    ]
+
+def _fts_lookup(step: str) -> bool:
+    """An FTS5 query with a MATCH (M) and a rowid range (><) constraint"""
+    return " VIRTUAL TABLE INDEX " in step and "M" in step.rsplit(":", 1)[-1] and "><" in step
+
+def explain(conn, statement) -> list:
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")]
+
+def _leading_column(step: str):
+    """First constrained column of an index SEARCH step, None for other steps"""
+    match = re.match(r"SEARCH \S+ USING (?:COVERING )?INDEX \S+ \((\w+)", step)
+    return match.group(1) if match else None
+
+def plan_problems(plan: list, ordered: bool, per_user: bool = True) -> list:
+    """
+    Full scans of a table or index, sorts an ordered query should not need,
+    and, for per-user queries, index searches not led by user_id (their cost
+    grows with every user's rows)
+    """
+    problems = [
+        step for step in plan
+        if step.startswith("SCAN ") and step != "SCAN CONSTANT ROW" and not _fts_lookup(step)
+    ]
+    if per_user:
+        problems += [
+            step for step in plan
+            if _leading_column(step) not in (None, "user_id")
+        ]
+    if ordered:
+        problems += [step for step in plan if "TEMP B-TREE" in step]
+    return problems
+
+def check_query_plans(engine) -> bool:
+    """Print the plan of every hot query; returns True if all use indexes"""
+    ok = True
+    with engine.connect() as conn:
+        for label, statement, ordered, per_user in hot_queries():
+            plan = explain(conn, statement)
+            problems = plan_problems(plan, ordered, per_user)
+            ok = ok and not problems
+            print(f"{'✅' if not problems else '❌'} {label}")
+            for step in plan:
+                print(f"     {step}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Assert that hot per-user queries use indexes")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--transactions-per-user", type=int, default=1000)
+    parser.add_argument("--database", help="SQLite file to build and keep (default: a temporary file)")
+    parser.add_argument("--force", action="store_true", help="Overwrite an existing --database file")
+    args = parser.parse_args()
+
+    if args.database and os.path.exists(args.database):
+        if not args.force:
+            parser.error(f"{args.database} already exists; pass --force to overwrite it")
+        os.remove(args.database)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.database or os.path.join(tmp_dir, "query_plans.db")
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        build_database(engine, args.users, args.transactions_per_user)
+        print(f"Synthetic database: {args.users * args.transactions_per_user} transactions "
+              f"for {args.users} users at {path}")
+
+        ok = check_query_plans(engine)
+        # Release the file before the temporary directory is removed
+        engine.dispose()
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
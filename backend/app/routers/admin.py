@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app.models import User
+from app.schemas import RedetectionRequest, RedetectionStatus, CategorizerTrainingStatus, CacheStats
+from app.auth import get_admin_user
+from services.redetection import (
+    start_redetection,
+    get_redetection_status,
+    REDETECT_WORKERS,
+    REDETECT_BATCH_SIZE
+)
+from services.category_training import get_trainer_stats
+from services.forecast_cache import get_forecast_cache_stats
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+@router.post("/redetect", response_model=RedetectionStatus, status_code=status.HTTP_202_ACCEPTED)
+def redetect_all_users(
+    request: RedetectionRequest,
+    admin: User = Depends(get_admin_user)
+):
+    """Start re-detecting subscriptions for every user in a process pool"""
+    run = start_redetection(
+        request.workers or REDETECT_WORKERS,
+        request.batch_size or REDETECT_BATCH_SIZE,
+        request.resume
+    )
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A re-detection run is already in progress"
+        )
+    return run
+
+@router.get("/redetect", response_model=RedetectionStatus)
+def get_redetection_progress(admin: User = Depends(get_admin_user)):
+    """Get progress of the current or last re-detection run"""
+    return get_redetection_status()
+
+@router.get("/categorizer", response_model=CategorizerTrainingStatus)
+def get_categorizer_training(admin: User = Depends(get_admin_user)):
+    """Get queue and checkpoint state of the online categorizer trainer"""
+    return get_trainer_stats()
+
+@router.get("/forecast-cache", response_model=CacheStats)
+def get_forecast_cache(admin: User = Depends(get_admin_user)):
+    """Get size and hit/miss counters of the forecast cache"""
+    return get_forecast_cache_stats()
@@ -1,39 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
 from app.database import get_db
+from app.async_database import get_async_db
 from app.models import User, Subscription, Notification
 from app.schemas import SubscriptionResponse, SubscriptionUpdate, NotificationResponse, UpcomingCharge
 from app.auth import get_current_user
+from app.etag import conditional_get, notifications_conditional_get
+from app.fast_json import fast_json, schema_columns, rows_to_dicts
+from app.data_version import bump_data_version
 
 router = APIRouter(prefix="/api/subscriptions", tags=["subscriptions"])
 
+SUBSCRIPTION_COLUMNS = schema_columns(SubscriptionResponse, Subscription)
+NOTIFICATION_COLUMNS = schema_columns(NotificationResponse, Notification)
+
 @router.get("", response_model=List[SubscriptionResponse])
-def get_subscriptions(
+async def get_subscriptions(
+    response: Response,
+    not_modified: Optional[Response] = Depends(conditional_get),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all detected subscriptions"""
-    subscriptions = db.query(Subscription).filter(
+    if not_modified:
+        return not_modified
+    subscriptions = (await db.execute(select(*SUBSCRIPTION_COLUMNS).where(
         Subscription.user_id == current_user.id
-    ).order_by(Subscription.amount.desc()).all()
+    ).order_by(Subscription.amount.desc()))).all()
     
-    return subscriptions
+    return fast_json(rows_to_dicts(subscriptions, SubscriptionResponse), response)
 
 @router.get("/upcoming", response_model=List[UpcomingCharge])
-def get_upcoming_charges(
+async def get_upcoming_charges(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get upcoming subscription charges in next 30 days"""
     from datetime import datetime, timedelta
     
-    subscriptions = db.query(Subscription).filter(
+    subscriptions = (await db.execute(select(Subscription).where(
         Subscription.user_id == current_user.id,
         Subscription.status == "active",
         Subscription.next_payment_date.isnot(None)
-    ).all()
+    ))).scalars().all()
     
     now = datetime.now()
     upcoming = []
@@ -72,6 +85,7 @@ def update_subscription(
     
     if update.status:
         subscription.status = update.status
+        bump_data_version(current_user.id, db)
     
     db.commit()
     db.refresh(subscription)
@@ -79,13 +93,17 @@ def update_subscription(
     return subscription
 
 @router.get("/notifications", response_model=List[NotificationResponse])
-def get_notifications(
+async def get_notifications(
+    response: Response,
+    not_modified: Optional[Response] = Depends(notifications_conditional_get),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user notifications"""
-    notifications = db.query(Notification).filter(
+    if not_modified:
+        return not_modified
+    notifications = (await db.execute(select(*NOTIFICATION_COLUMNS).where(
         Notification.user_id == current_user.id
-    ).order_by(Notification.created_at.desc()).limit(50).all()
+    ).order_by(Notification.created_at.desc()).limit(50))).all()
     
-    return notifications
+    return fast_json(rows_to_dicts(notifications, NotificationResponse), response)
@@ -1,24 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from datetime import date, datetime, time, timedelta
 from app.database import get_db
+from app.async_database import get_async_db
+from app.pagination import encode_cursor, decode_cursor, InvalidCursorError
 from app.models import User, Transaction
-from app.schemas import TransactionResponse, TransactionStats, BalanceForecast
+from app.schemas import (
+    TransactionResponse, TransactionPage, TransactionSearchResult, TransactionStats, BalanceForecast, IngestionJobResponse,
+    CategoryCorrection, CategoryCorrectionResponse
+)
 from app.auth import get_current_user
-from services.transaction_processor import process_csv_file
-from ml.periodicity_detector import detect_subscriptions
-from ml.forecaster import forecast_balance
+from app.etag import conditional_get
+from app.fast_json import fast_json, schema_columns, rows_to_dicts
+from app.data_version import bump_data_version, bump_notifications_version
+from services.transaction_processor import check_upload_size, UploadTooLargeError
+from services.ingestion_jobs import submit_upload, get_job
+from services.rollups import dashboard_stats_statement, stats_from_row
+from services.transaction_export import EXPORTERS, EXPORT_MEDIA_TYPES, ExportFormatUnavailable
+from services.transaction_search import search_statement, require_fts, SearchUnavailable
+from services.category_training import submit_correction
+from services.forecast_cache import get_forecast as get_cached_forecast
+from ml.forecaster import MAX_FORECAST_DAYS, shape_forecast
+from ml.categorizer import CATEGORIES
 
 router = APIRouter(prefix="/api/transactions", tags=["transactions"])
 
-@router.post("/upload", status_code=status.HTTP_201_CREATED)
+@router.post("/upload", response_model=IngestionJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_transactions(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
-    """Upload and process a CSV file of bank transactions"""
+    """
+    Queue a CSV file of bank transactions for background processing
+
+    Parsing, saving and subscription detection run in the ingestion worker
+    pool; poll /api/transactions/jobs/{job_id} for progress and counts.
+    """
     if not file.filename.endswith('.csv'):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -26,112 +48,241 @@ async def upload_transactions(
         )
     
     try:
-        # Process CSV and save transactions
-        transactions = await process_csv_file(file, current_user.id, db)
-        
-        # Run subscription detection
-        detect_subscriptions(current_user.id, db)
-        
-        return {
-            "message": f"Successfully uploaded {len(transactions)} transactions",
-            "transactions_count": len(transactions)
-        }
-    except Exception as e:
+        check_upload_size(file.size)
+        return await run_in_threadpool(submit_upload, file.file, file.filename, current_user.id)
+    except UploadTooLargeError as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing file: {str(e)}"
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+def get_ingestion_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Get stage, progress and final counts of an upload job"""
+    job = get_job(job_id, current_user.id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
         )
+    return job
+
+MAX_PAGE_SIZE = 1000
+MAX_SEARCH_RESULTS = 500
 
-@router.get("", response_model=List[TransactionResponse])
-def get_transactions(
-    skip: int = 0,
-    limit: int = 100,
+TRANSACTION_COLUMNS = schema_columns(TransactionResponse, Transaction)
+
+def _range_filters(start_date, end_date, min_amount, max_amount) -> list:
+    """Conditions for an inclusive date range and amount range"""
+    filters = []
+    if start_date is not None:
+        filters.append(Transaction.date >= datetime.combine(start_date, time.min))
+    if end_date is not None:
+        filters.append(Transaction.date < datetime.combine(end_date + timedelta(days=1), time.min))
+    if min_amount is not None:
+        filters.append(Transaction.amount >= min_amount)
+    if max_amount is not None:
+        filters.append(Transaction.amount <= max_amount)
+    return filters
+
+@router.get("", response_model=TransactionPage)
+async def get_transactions(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    category: Optional[str] = None,
+    is_recurring: Optional[bool] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get user's transactions"""
-    transactions = db.query(Transaction).filter(
-        Transaction.user_id == current_user.id
-    ).order_by(Transaction.date.desc()).offset(skip).limit(limit).all()
-    
-    return transactions
+    """
+    Get user's transactions, newest first, one page at a time
 
-@router.get("/stats", response_model=TransactionStats)
-def get_stats(
+    Pages are keyset-paginated on (date, id): pass the returned next_cursor
+    back as `cursor` with the same filters. Every page is an index range
+    scan starting after the cursor, so deep pages cost the same as the first.
+    Dates are inclusive. Rows are fetched as column tuples and encoded
+    with orjson, without per-row model validation.
+    """
+    try:
+        after = decode_cursor(cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    query = select(*TRANSACTION_COLUMNS).where(
+        Transaction.user_id == current_user.id,
+        *_range_filters(start_date, end_date, min_amount, max_amount)
+    )
+    if category is not None:
+        query = query.where(Transaction.category == category)
+    if is_recurring is not None:
+        query = query.where(Transaction.is_recurring == is_recurring)
+    if after is not None:
+        query = query.where(tuple_(Transaction.date, Transaction.id) < tuple_(*after))
+
+    # One extra row tells whether another page follows
+    rows = (await db.execute(query.order_by(
+        Transaction.date.desc(), Transaction.id.desc()
+    ).limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+
+    return fast_json({"items": rows_to_dicts(rows, TransactionResponse), "next_cursor": next_cursor})
+
+@router.get("/search", response_model=List[TransactionSearchResult])
+async def search_transactions(
+    q: str = Query(..., min_length=1, max_length=200),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    limit: int = Query(50, ge=1, le=MAX_SEARCH_RESULTS),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Full-text search over transaction descriptions, best match first
+
+    Every word in q must start a word of the description ("swig" finds
+    SWIGGY). Dates are inclusive. Served by the FTS5 index within the
+    user's own rows, so the cost follows the number of matches rather than
+    the size of the table.
+    """
+    try:
+        require_fts(db)
+        rows = (await db.execute(search_statement(
+            current_user.id, q, TRANSACTION_COLUMNS,
+            _range_filters(start_date, end_date, min_amount, max_amount),
+            limit, offset
+        ))).all()
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except SearchUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=str(e)
+        )
+    return fast_json(rows_to_dicts(rows, TransactionSearchResult))
+
+@router.get("/export")
+def export_transactions(
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stream all of the user's transactions, oldest first, as CSV, NDJSON or Parquet
+
+    Rows are read through a server-side cursor and written in batches, so
+    memory use does not grow with the history. The CSV is in the upload
+    format and can be uploaded again without loss.
+    """
+    try:
+        body = EXPORTERS[format](current_user.id)
+    except ExportFormatUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=str(e)
+        )
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="transactions.{format}"'}
+    )
+
+@router.put("/{transaction_id}/category", response_model=CategoryCorrectionResponse)
+def correct_category(
+    transaction_id: int,
+    correction: CategoryCorrection,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get transaction statistics"""
-    from sqlalchemy import func
-    from ml.periodicity_detector import calculate_monthly_subscription_cost
+    """
+    Correct a transaction's category
+
+    By default the user's other transactions with the same description are
+    updated too. The correction is queued for the online categorizer, which
+    learns from it in the background.
+    """
+    if correction.category not in CATEGORIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Category must be one of: {', '.join(CATEGORIES)}"
+        )
     
-    # Total transactions
-    total_transactions = db.query(Transaction).filter(
+    transaction = db.query(Transaction).filter(
+        Transaction.id == transaction_id,
         Transaction.user_id == current_user.id
-    ).count()
-    
-    # Total subscriptions
-    from app.models import Subscription
-    total_subscriptions = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == "active"
-    ).count()
-    
-    # Monthly subscription cost
-    monthly_cost = calculate_monthly_subscription_cost(current_user.id, db)
-    
-    # Total spent this month
-    current_month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    total_spent_this_month = db.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.date >= current_month_start,
-        Transaction.amount < 0  # Only debits
-    ).scalar() or 0.0
-    
-    # Total spent overall (lifetime)
-    total_spent_overall = db.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.amount < 0  # Only debits
-    ).scalar() or 0.0
+    ).first()
     
-    # Average spent per month
-    # Get number of months between first transaction and now
-    first_transaction_date = db.query(func.min(Transaction.date)).filter(
-        Transaction.user_id == current_user.id
-    ).scalar()
+    if not transaction:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Transaction not found"
+        )
     
-    if first_transaction_date:
-        now = datetime.now()
-        num_months = (now.year - first_transaction_date.year) * 12 + (now.month - first_transaction_date.month) + 1
-        avg_spent_per_month = total_spent_overall / num_months
+    query = db.query(Transaction).filter(Transaction.user_id == current_user.id)
+    if correction.apply_to_same_description:
+        query = query.filter(Transaction.description == transaction.description)
     else:
-        avg_spent_per_month = 0.0
+        query = query.filter(Transaction.id == transaction.id)
+    updated = query.update({Transaction.category: correction.category}, synchronize_session=False)
+    bump_data_version(current_user.id, db)
+    db.commit()
     
     return {
-        "total_transactions": total_transactions,
-        "total_subscriptions": total_subscriptions,
-        "monthly_subscription_cost": abs(monthly_cost),
-        "total_spent_this_month": abs(total_spent_this_month),
-        "avg_spent_per_month": abs(avg_spent_per_month),
-        "total_spent_overall": abs(total_spent_overall)
+        "updated": updated,
+        "queued_for_training": submit_correction(transaction.description, correction.category)
     }
 
+@router.get("/stats", response_model=TransactionStats)
+async def get_stats(
+    not_modified: Optional[Response] = Depends(conditional_get),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get transaction statistics, read from the monthly rollups in one query"""
+    if not_modified:
+        return not_modified
+    return stats_from_row((await db.execute(dashboard_stats_statement(current_user.id))).one())
+
 @router.delete("", status_code=status.HTTP_204_NO_CONTENT)
 def delete_transactions(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Delete all transactions, subscriptions, and notifications for the current user"""
-    from app.models import Subscription, Notification
+    """Delete all transactions, merchant groups, subscriptions, and notifications for the current user"""
+    from app.models import Subscription, Notification, MerchantGroup, MonthlyRollup
     
     try:
         # Delete transactions
         db.query(Transaction).filter(Transaction.user_id == current_user.id).delete(synchronize_session=False)
+        # Delete monthly rollups
+        db.query(MonthlyRollup).filter(MonthlyRollup.user_id == current_user.id).delete(synchronize_session=False)
+        # Delete merchant groups
+        db.query(MerchantGroup).filter(MerchantGroup.user_id == current_user.id).delete(synchronize_session=False)
         # Delete subscriptions
         db.query(Subscription).filter(Subscription.user_id == current_user.id).delete(synchronize_session=False)
         # Delete notifications
         db.query(Notification).filter(Notification.user_id == current_user.id).delete(synchronize_session=False)
         
+        bump_data_version(current_user.id, db)
+        bump_notifications_version(current_user.id, db)
         db.commit()
         return None
     except Exception as e:
@@ -143,9 +294,27 @@ def delete_transactions(
 
 @router.get("/forecast", response_model=BalanceForecast)
 def get_forecast(
+    response: Response,
+    days_ahead: int = Query(30, ge=1, le=MAX_FORECAST_DAYS),
+    simulate: bool = False,
+    history_days: Optional[int] = Query(None, ge=0),
+    points: Optional[int] = Query(None, ge=10, le=10000),
+    not_modified: Optional[Response] = Depends(conditional_get),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get balance forecast for next 30 days"""
-    forecast = forecast_balance(current_user.id, db)
-    return forecast
+    """
+    Get balance forecast for the next days_ahead days (default 30), cached per data version
+
+    With simulate=true, returns Monte Carlo p10/p50/p90 bands and the daily
+    probability of a low balance instead of a single projection.
+    history_days limits the history returned and points downsamples the
+    series for charting; low balance dates come from the full daily series.
+    """
+    if not_modified:
+        return not_modified
+    forecast = get_cached_forecast(current_user.id, db, days_ahead, simulate)
+    if history_days is not None or points is not None:
+        forecast = shape_forecast(forecast, history_days, points)
+    # Same keys the response model would emit, null for the simulation-only ones
+    return fast_json({field: forecast.get(field) for field in BalanceForecast.model_fields}, response)
@@ -44,6 +44,75 @@ class TransactionResponse(TransactionBase):
     class Config:
         from_attributes = True
 
+class TransactionPage(BaseModel):
+    items: List[TransactionResponse]
+    next_cursor: Optional[str] = None  # Pass as `cursor` to get the next page; None on the last page
+
+class TransactionSearchResult(TransactionResponse):
+    score: float  # Share of the description matched by the query, higher is better
+
+class RowError(BaseModel):
+    row: int
+    column: str
+    value: str
+    error: str
+
+class IngestionJobResponse(BaseModel):
+    id: str
+    filename: str
+    status: str  # "queued", "running", "completed", "failed"
+    stage: str  # "queued", "parsing", "detecting", "done"
+    progress: float
+    rows_processed: int
+    transactions_count: Optional[int] = None
+    duplicates_skipped: Optional[int] = None
+    invalid_rows: Optional[int] = None
+    errors: List[RowError] = []
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+class CategoryCorrection(BaseModel):
+    category: str
+    apply_to_same_description: bool = True
+
+class CategoryCorrectionResponse(BaseModel):
+    updated: int
+    queued_for_training: bool
+
+# Admin Schemas
+class RedetectionRequest(BaseModel):
+    workers: Optional[int] = Field(None, ge=1)
+    batch_size: Optional[int] = Field(None, ge=1)
+    resume: bool = True
+
+class RedetectionStatus(BaseModel):
+    status: str  # "idle", "running", "completed", "failed"
+    total_users: int
+    completed_users: int
+    failed_users: int
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class CategorizerTrainingStatus(BaseModel):
+    running: bool
+    pending: int
+    batches: int
+    corrections: int
+    dropped: int
+    samples_seen: Optional[int] = None
+    last_checkpoint: Optional[float] = None
+
+class CacheStats(BaseModel):
+    size: int
+    maxsize: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
 # Subscription Schemas
 class SubscriptionResponse(BaseModel):
     id: int
@@ -87,6 +156,11 @@ class BalanceForecast(BaseModel):
     dates: List[str]
     predicted_balance: List[float]
     low_balance_dates: List[str]
+    # Only in simulation mode: quantile bands and daily low-balance probability
+    p10: Optional[List[float]] = None
+    p50: Optional[List[float]] = None
+    p90: Optional[List[float]] = None
+    probability_below_threshold: Optional[List[float]] = None
     
 class UpcomingCharge(BaseModel):
     subscription_name: str
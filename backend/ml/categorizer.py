@@ -1,9 +1,51 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.model_selection import train_test_split
+import logging
 import numpy as np
 import pickle
 import os
+import threading
+import time
+from dotenv import load_dotenv
+
+from ml.keyword_matcher import get_keyword_rules
+from ml.model_artifact import save_artifact, is_artifact, LinearTextModel, ModelArtifactError
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Model artifact directories (see ml/model_artifact.py)
+CATEGORIZER_MODEL_PATH = os.getenv("CATEGORIZER_MODEL_PATH", "categorizer_model")
+
+# "batch": TF-IDF model trained offline; "online": hashing model updated from corrections
+CATEGORIZER_MODE = os.getenv("CATEGORIZER_MODE", "batch")
+ONLINE_MODEL_PATH = os.getenv("ONLINE_MODEL_PATH", "categorizer_online")
+
+# Hashed feature space of the online model and samples it must see before
+# its predictions replace the keyword rules
+ONLINE_HASH_FEATURES = 2 ** 18
+ONLINE_MIN_SAMPLES = int(os.getenv("ONLINE_MIN_SAMPLES", "50"))
+
+CATEGORIES = [
+    'Streaming',      # Netflix, Spotify, Prime
+    'Gym',            # Gym memberships
+    'Utilities',      # Electricity, Water, Internet
+    'Food',           # Groceries, Restaurants
+    'EMI',            # Loan payments
+    'Shopping',       # Online/offline shopping
+    'Other'           # Miscellaneous
+]
+
+def rule_based_category(description):
+    """
+    Simple rule-based categorization when ML model is not trained
+    
+    Keyword rules are loaded from KEYWORD_RULES_PATH; the first category in
+    file order with a keyword in the description wins.
+    """
+    return get_keyword_rules().category(description)
 
 class TransactionCategorizer:
     """
@@ -13,16 +55,22 @@ class TransactionCategorizer:
     def __init__(self):
         self.vectorizer = TfidfVectorizer(max_features=100, ngram_range=(1, 2))
         self.model = LogisticRegression(max_iter=1000)
-        self.categories = [
-            'Streaming',      # Netflix, Spotify, Prime
-            'Gym',            # Gym memberships
-            'Utilities',      # Electricity, Water, Internet
-            'Food',           # Groceries, Restaurants
-            'EMI',            # Loan payments
-            'Shopping',       # Online/offline shopping
-            'Other'           # Miscellaneous
-        ]
+        self.categories = list(CATEGORIES)
         self.is_trained = False
+        # Memory-mapped artifact used for predictions once loaded
+        self.artifact = None
+        self.load_seconds = None
+        self._pending_path = None
+        self._load_lock = threading.Lock()
+    
+    @property
+    def is_trained(self):
+        self._ensure_loaded()
+        return self._trained
+    
+    @is_trained.setter
+    def is_trained(self, value):
+        self._trained = value
     
     def train(self, descriptions, labels):
         """
@@ -34,6 +82,8 @@ class TransactionCategorizer:
         """
         X = self.vectorizer.fit_transform(descriptions)
         self.model.fit(X, labels)
+        self.artifact = None
+        self._pending_path = None
         self.is_trained = True
     
     def predict(self, description):
@@ -46,68 +96,198 @@ class TransactionCategorizer:
         Returns:
             Predicted category
         """
+        return self.predict_batch([description])[0]
+    
+    def predict_batch(self, descriptions):
+        """
+        Predict categories for many descriptions with one transform/predict call
+        
+        Args:
+            descriptions: List of transaction description strings
+            
+        Returns:
+            List of predicted categories, in the same order
+        """
+        if not descriptions:
+            return []
+        
         if not self.is_trained:
             # Use rule-based categorization if not trained
-            return self._rule_based_categorization(description)
+            return [self._rule_based_categorization(d) for d in descriptions]
         
-        X = self.vectorizer.transform([description])
-        return self.model.predict(X)[0]
+        if self.artifact is not None:
+            return self.artifact.predict_batch(descriptions)
+        
+        X = self.vectorizer.transform(descriptions)
+        return self.model.predict(X).tolist()
     
     def _rule_based_categorization(self, description):
         """
         Simple rule-based categorization when ML model is not trained
         """
-        description_upper = description.upper()
-        
-        # Streaming services
-        streaming_keywords = ['NETFLIX', 'SPOTIFY', 'PRIME', 'AMAZON PRIME', 'DISNEY', 
-                             'HBO', 'APPLE MUSIC', 'YOUTUBE PREMIUM']
-        if any(kw in description_upper for kw in streaming_keywords):
-            return 'Streaming'
+        return rule_based_category(description)
+    
+    def save_model(self, filepath=CATEGORIZER_MODEL_PATH):
+        """Save trained model as a versioned artifact directory"""
+        if self.is_trained and self.artifact is None:
+            save_artifact(filepath, self.vectorizer, self.model)
+    
+    def load_model(self, filepath=CATEGORIZER_MODEL_PATH):
+        """
+        Load a model artifact, memory-mapping its arrays
         
-        # Gym
-        gym_keywords = ['GYM', 'FITNESS', 'PLANET', 'GOLD', 'CROSSFIT', 'YOGA']
-        if any(kw in description_upper for kw in gym_keywords):
-            return 'Gym'
+        A legacy pickle at `filepath` or `filepath`.pkl is still read; convert
+        it with `python -m ml.model_artifact convert`. The load time is kept
+        in `load_seconds` and logged at INFO level.
+        """
+        start = time.perf_counter()
+        if is_artifact(filepath):
+            self.artifact = LinearTextModel(filepath)
+            self.is_trained = True
+        else:
+            legacy_path = filepath if os.path.isfile(filepath) else f"{filepath}.pkl"
+            if not os.path.isfile(legacy_path):
+                return
+            with open(legacy_path, 'rb') as f:
+                data = pickle.load(f)
+                self.vectorizer = data['vectorizer']
+                self.model = data['model']
+                self.is_trained = True
+        self.load_seconds = time.perf_counter() - start
+        logger.info("Categorizer model loaded from %s in %.1f ms", filepath, self.load_seconds * 1000)
+    
+    def defer_load(self, filepath=CATEGORIZER_MODEL_PATH):
+        """Load the model from `filepath` on first use instead of now"""
+        self._pending_path = filepath
+    
+    def _ensure_loaded(self):
+        if self._pending_path is None:
+            return
+        with self._load_lock:
+            if self._pending_path is not None:
+                filepath = self._pending_path
+                self.load_model(filepath)
+                self._pending_path = None
+
+class OnlineCategorizer:
+    """
+    Incrementally trained categorization using hashed n-gram features +
+    SGD logistic regression
+    
+    The hashing vectorizer is stateless, so new vocabulary needs no refit and
+    partial_fit can learn from each mini-batch of corrections as it arrives.
+    """
+    
+    def __init__(self):
+        self.vectorizer = HashingVectorizer(
+            n_features=ONLINE_HASH_FEATURES, ngram_range=(1, 2), alternate_sign=False
+        )
+        self.model = SGDClassifier(loss='log_loss', alpha=1e-5)
+        self.categories = list(CATEGORIES)
+        self.samples_seen = 0
+        self._lock = threading.RLock()
+    
+    @property
+    def is_trained(self):
+        return self.samples_seen >= ONLINE_MIN_SAMPLES
+    
+    def partial_fit(self, descriptions, labels):
+        """
+        Update the model with one mini-batch
         
-        # Utilities
-        utility_keywords = ['ELECTRICITY', 'WATER', 'GAS', 'INTERNET', 'MOBILE', 
-                           'PHONE', 'BROADBAND', 'WIFI']
-        if any(kw in description_upper for kw in utility_keywords):
-            return 'Utilities'
+        Args:
+            descriptions: List of transaction descriptions
+            labels: List of category labels, each one of CATEGORIES
+        """
+        if not descriptions:
+            return
+        X = self.vectorizer.transform(descriptions)
+        with self._lock:
+            self.model.partial_fit(X, labels, classes=self.categories)
+            self.samples_seen += len(descriptions)
+    
+    def predict(self, description):
+        """Predict category for a transaction description"""
+        return self.predict_batch([description])[0]
+    
+    def predict_batch(self, descriptions):
+        """
+        Predict categories for many descriptions with one transform/predict call
         
-        # Food
-        food_keywords = ['RESTAURANT', 'CAFE', 'FOOD', 'GROCERY', 'SWIGGY', 
-                        'ZOMATO', 'UBER EATS', 'DOMINO', 'PIZZA']
-        if any(kw in description_upper for kw in food_keywords):
-            return 'Food'
+        Uses the keyword rules until ONLINE_MIN_SAMPLES samples were learned.
+        """
+        if not descriptions:
+            return []
         
-        # EMI
-        emi_keywords = ['EMI', 'LOAN', 'CREDIT CARD', 'INSTALLMENT', 'FINANCE']
-        if any(kw in description_upper for kw in emi_keywords):
-            return 'EMI'
+        if not self.is_trained:
+            return [rule_based_category(d) for d in descriptions]
         
-        # Shopping
-        shopping_keywords = ['AMAZON', 'FLIPKART', 'MYNTRA', 'MALL', 'STORE', 'SHOP']
-        if any(kw in description_upper for kw in shopping_keywords):
-            return 'Shopping'
+        X = self.vectorizer.transform(descriptions)
+        with self._lock:
+            return self.model.predict(X).tolist()
+    
+    def adopt(self, other):
+        """Take over the model and sample count of another OnlineCategorizer"""
+        with self._lock:
+            self.model = other.model
+            self.samples_seen = other.samples_seen
+
+    def save_model(self, filepath=ONLINE_MODEL_PATH):
+        """Checkpoint the model as an artifact directory"""
+        with self._lock:
+            if self.samples_seen == 0:
+                return
+            save_artifact(
+                filepath, self.vectorizer, self.model,
+                extra={'samples_seen': self.samples_seen, 't': self.model.t_}
+            )
+    
+    def load_model(self, filepath=ONLINE_MODEL_PATH):
+        """
+        Restore a checkpoint so training can continue; returns False if
+        there is none. Arrays are copied, since partial_fit updates them.
+        """
+        if not is_artifact(filepath):
+            return False
+        checkpoint = LinearTextModel(filepath, mmap=False)
+        if checkpoint.manifest['vectorizer'] != 'hashing' or checkpoint.manifest['n_features'] != ONLINE_HASH_FEATURES:
+            raise ModelArtifactError(f"{filepath} is not a checkpoint of the online categorizer")
         
-        return 'Other'
-    
-    def save_model(self, filepath='categorizer_model.pkl'):
-        """Save trained model to file"""
-        if self.is_trained:
-            with open(filepath, 'wb') as f:
-                pickle.dump({'vectorizer': self.vectorizer, 'model': self.model}, f)
-    
-    def load_model(self, filepath='categorizer_model.pkl'):
-        """Load trained model from file"""
-        if os.path.exists(filepath):
-            with open(filepath, 'rb') as f:
-                data = pickle.load(f)
-                self.vectorizer = data['vectorizer']
-                self.model = data['model']
-                self.is_trained = True
+        model = SGDClassifier(loss='log_loss', alpha=1e-5)
+        model.classes_ = np.array(checkpoint.manifest['classes'], dtype=object)
+        model.coef_ = np.array(checkpoint.coef)
+        model.intercept_ = np.array(checkpoint.intercept)
+        model.n_features_in_ = checkpoint.manifest['n_features']
+        model.t_ = checkpoint.manifest['extra']['t']
+        with self._lock:
+            self.model = model
+            self.samples_seen = checkpoint.manifest['extra']['samples_seen']
+        return True
+
+_categorizer = None
+_categorizer_lock = threading.Lock()
+
+def get_categorizer():
+    """
+    Process-wide categorizer
+    
+    An OnlineCategorizer restored from ONLINE_MODEL_PATH when CATEGORIZER_MODE
+    is "online", otherwise a TransactionCategorizer whose artifact at
+    CATEGORIZER_MODEL_PATH is loaded lazily on first prediction.
+    Both fall back to rule-based categorization until trained.
+    """
+    global _categorizer
+    if _categorizer is None:
+        with _categorizer_lock:
+            if _categorizer is None:
+                if CATEGORIZER_MODE == "online":
+                    categorizer = OnlineCategorizer()
+                    categorizer.load_model(ONLINE_MODEL_PATH)
+                else:
+                    categorizer = TransactionCategorizer()
+                    categorizer.defer_load(CATEGORIZER_MODEL_PATH)
+                _categorizer = categorizer
+    return _categorizer
 
 def categorize_transactions(db, user_id):
     """
@@ -115,7 +295,7 @@ def categorize_transactions(db, user_id):
     """
     from app.models import Transaction
     
-    categorizer = TransactionCategorizer()
+    categorizer = get_categorizer()
     
     # Get all uncategorized transactions
     transactions = db.query(Transaction).filter(
@@ -123,8 +303,8 @@ def categorize_transactions(db, user_id):
         Transaction.category.is_(None)
     ).all()
     
-    for trans in transactions:
-        category = categorizer.predict(trans.description)
+    categories = categorizer.predict_batch([trans.description for trans in transactions])
+    for trans, category in zip(transactions, categories):
         trans.category = category
     
     db.commit()
@@ -5,93 +5,374 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 
 from app.models import Transaction, Subscription
+from ml.period_engine import period_days
+
+# Longest supported forecast horizon, in days
+MAX_FORECAST_DAYS = 365
+
+# Balances below this are reported as low balance dates
+LOW_BALANCE_THRESHOLD = 1000
+
+# Monte Carlo forecast: paths per forecast, days simulated per block (memory
+# is bounded by paths x block days whatever the horizon), days of history
+# the daily flows are fitted on, and the probability of a low balance that
+# flags a date. 2000 paths put the p10/p90 bands within about 1.5
+# percentile points; time grows with paths x days x spending categories.
+SIMULATION_PATHS = 2000
+SIMULATION_BLOCK_DAYS = 30
+SIMULATION_LOOKBACK_DAYS = 180
+LOW_BALANCE_RISK = 0.2
+
+# Per-date series of a forecast, windowed and downsampled together
+SERIES_KEYS = ("predicted_balance", "p10", "p50", "p90", "probability_below_threshold")
+
+def daily_history(dates, amounts):
+    """
+    Collapse transactions into one running balance per calendar day
+    
+    Returns:
+        (sorted datetime64[D] days, balance at the end of each day)
+    """
+    days = np.asarray(dates, dtype='datetime64[D]')
+    unique_days, day_index = np.unique(days, return_inverse=True)
+    daily_amounts = np.bincount(day_index, weights=np.asarray(amounts, dtype=float), minlength=len(unique_days))
+    return unique_days, np.cumsum(daily_amounts)
+
+def expand_charges(first_offsets, periods, amounts, days_ahead: int):
+    """
+    Total charges on each day of the horizon, for every occurrence of every
+    recurring charge
+    
+    Args:
+        first_offsets: day of each charge's next occurrence, relative to today;
+            past occurrences are rolled forward by whole periods
+        periods: days between occurrences (<= 0 means a one-off charge)
+        amounts: amount of each occurrence
+    
+    Returns:
+        array of length days_ahead + 1 indexed by day offset (0 = today)
+    """
+    first_offsets = np.asarray(first_offsets, dtype=np.int64)
+    amounts = np.asarray(amounts, dtype=float)
+    periods = np.asarray(periods, dtype=np.int64)
+    one_off = periods <= 0
+    periods = np.where(one_off, days_ahead + 1, periods)
+    
+    # First occurrence from tomorrow on
+    behind = np.maximum(1 - first_offsets, 0)
+    starts = first_offsets + np.where(one_off, 0, -(-behind // periods) * periods)
+    counts = np.where(
+        (starts >= 1) & (starts <= days_ahead),
+        (days_ahead - starts) // periods + 1,
+        0
+    )
+    
+    # One entry per occurrence: start + k * period for k in range(count)
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(counts)), counts)
+    k = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    offsets = starts[owner] + k * periods[owner]
+    
+    return np.bincount(offsets, weights=amounts[owner], minlength=days_ahead + 1)
+
+def _subscription_charges(user_id: int, db: Session, today, days_ahead: int):
+    """Charges of the user's active subscriptions on each day of the horizon"""
+    subscriptions = db.query(
+        Subscription.next_payment_date, Subscription.frequency, Subscription.amount
+    ).filter(
+        Subscription.user_id == user_id,
+        Subscription.status == "active",
+        Subscription.next_payment_date.isnot(None)
+    ).all()
+    
+    if not subscriptions:
+        return np.zeros(days_ahead + 1)
+    
+    next_dates, frequencies, sub_amounts = zip(*subscriptions)
+    first_offsets = (np.asarray(next_dates, dtype='datetime64[D]') - today).astype(np.int64)
+    periods = [period_days(frequency) or 0 for frequency in frequencies]
+    return expand_charges(first_offsets, periods, sub_amounts, days_ahead)
+
+def _empty_forecast():
+    return {
+        "dates": [],
+        "predicted_balance": [],
+        "low_balance_dates": []
+    }
 
 def forecast_balance(user_id: int, db: Session, days_ahead: int = 30):
     """
     Forecast balance for the next N days
     
+    Every active subscription is expanded into all of its occurrences in the
+    horizon, so the cost does not depend on days_ahead (up to MAX_FORECAST_DAYS).
+    
     Returns:
         BalanceForecast with dates, predicted balances, and low balance warnings
     """
     # Get transaction history
-    transactions = db.query(Transaction).filter(
+    rows = db.query(Transaction.date, Transaction.amount).filter(
         Transaction.user_id == user_id
-    ).order_by(Transaction.date).all()
-    
-    if not transactions:
-        return {
-            "dates": [],
-            "predicted_balance": [],
-            "low_balance_dates": []
-        }
-    
-    # Create daily balance series from transactions
-    df = pd.DataFrame([
-        {'date': t.date, 'amount': t.amount} 
-        for t in transactions
-    ])
-    df['date'] = pd.to_datetime(df['date'])
-    
-    # Group by date and sum amounts
-    daily_df = df.groupby('date')['amount'].sum().reset_index()
-    daily_df = daily_df.sort_values('date')
+    ).all()
     
-    # Calculate cumulative balance
-    daily_df['balance'] = daily_df['amount'].cumsum()
+    if not rows:
+        return _empty_forecast()
     
     # --- Part 1: Historical Timeline ---
-    timeline_dates = []
-    timeline_balances = []
-    
-    for _, row in daily_df.iterrows():
-        timeline_dates.append(row['date'].strftime('%Y-%m-%d'))
-        timeline_balances.append(round(row['balance'], 2))
+    dates, amounts = zip(*rows)
+    history_days, history_balance = daily_history(dates, amounts)
     
-    # Get current balance and last date
-    current_balance = timeline_balances[-1] if timeline_balances else 0
-    now = datetime.now()
+    # Get current balance
+    current_balance = round(float(history_balance[-1]), 2)
+    today = np.datetime64(datetime.now().date(), 'D')
     
     # --- Part 2: Future Forecast ---
-    # Get upcoming subscriptions
-    subscriptions = db.query(Subscription).filter(
-        Subscription.user_id == user_id,
-        Subscription.status == "active"
+    days_ahead = min(days_ahead, MAX_FORECAST_DAYS)
+    charges = _subscription_charges(user_id, db, today, days_ahead)
+    
+    # Predict for the next days_ahead days starting from tomorrow
+    forecast_days = today + np.arange(1, days_ahead + 1)
+    future_balance = current_balance - np.cumsum(charges[1:])
+    
+    # Combine historical and forecast
+    combined_dates = np.datetime_as_string(np.concatenate([history_days, forecast_days]))
+    combined_balances = np.round(np.concatenate([history_balance, future_balance]), 2)
+    
+    # Identify low balance dates
+    low_balance_dates = combined_dates[combined_balances < LOW_BALANCE_THRESHOLD]
+    
+    return {
+        "dates": combined_dates.tolist(),
+        "predicted_balance": combined_balances.tolist(),
+        "low_balance_dates": low_balance_dates.tolist()
+    }
+
+def fit_daily_flows(day_offsets, amounts, streams, window_days: int):
+    """
+    Fit a compound daily distribution for each stream of cash flows
+    
+    A stream (a spending category, or income) is active on a day with
+    probability = share of days in the window with any flow, and an active
+    day's total is drawn from that stream's observed daily totals.
+    
+    Args:
+        day_offsets: day of each transaction within the window (0-based)
+        amounts: signed transaction amounts
+        streams: integer stream id of each transaction
+        window_days: number of days the history covers
+    
+    Returns:
+        list of (probability, array of observed daily totals), one per stream
+    """
+    day_offsets = np.asarray(day_offsets, dtype=np.int64)
+    streams = np.asarray(streams, dtype=np.int64)
+    if len(streams) == 0:
+        return []
+    
+    # Total per (stream, day) with one unique + bincount
+    keys = streams * window_days + day_offsets
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inverse, weights=np.asarray(amounts, dtype=float))
+    key_streams = unique_keys // window_days
+    
+    flows = []
+    for stream in np.unique(key_streams):
+        observed = totals[key_streams == stream]
+        flows.append((len(observed) / window_days, observed))
+    return flows
+
+def simulate_paths(start_balance, charges, flows, n_paths: int, rng):
+    """
+    Simulate balance paths over a span of days in one batch
+    
+    Each stream needs one uniform draw per (path, day): u < probability marks
+    an active day, and u / probability, uniform on [0, 1) given that, picks
+    which observed daily total it resamples.
+    
+    Args:
+        start_balance: balance before the first day, a number or one per
+            path as an (n_paths, 1) array
+        charges: known subscription charges per day offset (0 = the day
+            before the span)
+        flows: output of fit_daily_flows
+    
+    Returns:
+        array of shape (n_paths, days) with the end-of-day balance of each path
+    """
+    days = len(charges) - 1
+    daily = np.zeros(n_paths * days)
+    for probability, observed in flows:
+        u = rng.random(n_paths * days, dtype=np.float32)
+        active = np.flatnonzero(u < probability)
+        index = (u[active] * np.float32(len(observed) / probability)).astype(np.intp)
+        np.minimum(index, len(observed) - 1, out=index)
+        daily[active] += observed[index]
+    daily = daily.reshape(n_paths, days)
+    daily -= np.asarray(charges[1:], dtype=float)
+    return start_balance + np.cumsum(daily, axis=1)
+
+def simulate_bands(start_balance: float, charges, flows, n_paths: int, rng):
+    """
+    p10/p50/p90 balances and the probability of being below
+    LOW_BALANCE_THRESHOLD for each day of the horizon
+
+    Paths are simulated SIMULATION_BLOCK_DAYS at a time, each block
+    continuing from the previous block's end balances, and only the
+    per-day statistics are kept.
+
+    Returns:
+        array of shape (4, days): p10, p50, p90, probability below threshold
+    """
+    days = len(charges) - 1
+    balance = start_balance
+    blocks = []
+    for start in range(0, days, SIMULATION_BLOCK_DAYS):
+        paths = simulate_paths(balance, charges[start:start + SIMULATION_BLOCK_DAYS + 1], flows, n_paths, rng)
+        # Quantiles per day over contiguous rows
+        by_day = np.ascontiguousarray(paths.T)
+        blocks.append(np.vstack([
+            np.quantile(by_day, [0.1, 0.5, 0.9], axis=1),
+            (by_day < LOW_BALANCE_THRESHOLD).mean(axis=1)
+        ]))
+        balance = paths[:, -1:]
+    return np.hstack(blocks) if blocks else np.zeros((4, 0))
+
+def simulate_balance(
+    user_id: int,
+    db: Session,
+    days_ahead: int = 30,
+    n_paths: int = SIMULATION_PATHS,
+    seed=None
+):
+    """
+    Probabilistic balance forecast with Monte Carlo quantile bands
+    
+    Daily spend per category and daily income are fitted from the last
+    SIMULATION_LOOKBACK_DAYS of history; transactions already marked as
+    recurring are left out, since active subscriptions are charged on their
+    schedule in every path. Memory use does not grow with the horizon; time
+    grows with n_paths x days_ahead.
+    
+    Returns:
+        BalanceForecast whose predicted_balance is the median path, plus
+        p10/p50/p90 bands and the probability of being below
+        LOW_BALANCE_THRESHOLD on each date. History is repeated in the bands.
+        Low balance dates are days with at least LOW_BALANCE_RISK probability.
+    """
+    rows = db.query(
+        Transaction.date, Transaction.amount, Transaction.category, Transaction.is_recurring
+    ).filter(
+        Transaction.user_id == user_id
     ).all()
     
-    forecast_dates = []
-    forecast_balances = []
+    if not rows:
+        return {**_empty_forecast(), "p10": [], "p50": [], "p90": [], "probability_below_threshold": []}
     
-    balance = current_balance
+    dates, amounts, categories, recurring = zip(*rows)
+    days = pd.to_datetime(list(dates)).values.astype('datetime64[D]')
+    history_days, history_balance = daily_history(days, amounts)
+    current_balance = round(float(history_balance[-1]), 2)
+    today = np.datetime64(datetime.now().date(), 'D')
+    days_ahead = min(days_ahead, MAX_FORECAST_DAYS)
+    charges = _subscription_charges(user_id, db, today, days_ahead)
     
-    # Predict for next 30 days starting from tomorrow
-    for i in range(1, days_ahead + 1):
-        forecast_date = now + timedelta(days=i)
-        forecast_dates.append(forecast_date.strftime('%Y-%m-%d'))
-        
-        # Check for subscriptions due on this date
-        for sub in subscriptions:
-            if sub.next_payment_date and sub.next_payment_date.date() == forecast_date.date():
-                balance -= sub.amount
-        
-        forecast_balances.append(round(balance, 2))
+    # Fit on the last SIMULATION_LOOKBACK_DAYS of history
+    amounts = np.asarray(amounts, dtype=float)
+    window_start = max(history_days[0], history_days[-1] - (SIMULATION_LOOKBACK_DAYS - 1))
+    window_days = int((history_days[-1] - window_start).astype(np.int64)) + 1
+    keep = (days >= window_start) & ~np.asarray(recurring, dtype=bool)
     
-    # Combine historical and forecast
-    combined_dates = timeline_dates + forecast_dates
-    combined_balances = timeline_balances + forecast_balances
+    # Income is one stream, spending is one stream per category
+    labels = np.array([
+        "__income__" if amount > 0 else (category or "Other")
+        for amount, category in zip(amounts, categories)
+    ], dtype=object)
+    _, streams = np.unique(labels[keep].astype(str), return_inverse=True)
+    flows = fit_daily_flows((days[keep] - window_start).astype(np.int64), amounts[keep], streams, window_days)
+    
+    rng = np.random.default_rng(user_id if seed is None else seed)
+    p10, p50, p90, probability_below = simulate_bands(current_balance, charges, flows, n_paths, rng)
+    
+    forecast_days = today + np.arange(1, days_ahead + 1)
+    combined_dates = np.datetime_as_string(np.concatenate([history_days, forecast_days]))
+    history_balance = np.round(history_balance, 2)
     
-    # Identify low balance dates (balance < 1000)
-    low_balance_threshold = 1000
-    low_balance_dates = [
-        date for date, bal in zip(combined_dates, combined_balances) 
-        if bal < low_balance_threshold
-    ]
+    def band(values):
+        return np.round(np.concatenate([history_balance, values]), 2).tolist()
+    
+    probability = np.concatenate([
+        (history_balance < LOW_BALANCE_THRESHOLD).astype(float),
+        probability_below
+    ])
     
     return {
-        "dates": combined_dates,
-        "predicted_balance": combined_balances,
-        "low_balance_dates": low_balance_dates
+        "dates": combined_dates.tolist(),
+        "predicted_balance": band(p50),
+        "low_balance_dates": combined_dates[probability >= LOW_BALANCE_RISK].tolist(),
+        "p10": band(p10),
+        "p50": band(p50),
+        "p90": band(p90),
+        "probability_below_threshold": np.round(probability, 4).tolist()
     }
 
+def downsample_indices(values, max_points: int):
+    """
+    Min/max bucket downsampling
+    
+    The series is cut into (max_points - 2) // 2 equal buckets and the lowest
+    and highest point of each is kept, plus both endpoints, so dips below the
+    low balance threshold survive.
+    
+    Returns: sorted indices of at most max_points points
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    
+    buckets = max((max_points - 2) // 2, 1)
+    inner = np.arange(1, n - 1)
+    bucket = (inner - 1) * buckets // (n - 2)
+    order = np.lexsort((values[inner], bucket))
+    sorted_bucket = bucket[order]
+    boundary = sorted_bucket[1:] != sorted_bucket[:-1]
+    lowest = np.concatenate([[True], boundary])
+    highest = np.concatenate([boundary, [True]])
+    return np.unique(np.concatenate([[0], inner[order[lowest | highest]], [n - 1]]))
+
+def shape_forecast(forecast: dict, history_days=None, max_points=None) -> dict:
+    """
+    Window and downsample a forecast for display
+    
+    Keeps history from the last history_days days plus the whole forecast,
+    then reduces it to at most max_points points with downsample_indices.
+    low_balance_dates were found on the full-resolution series and are only
+    clipped to the window. The input dict is not modified.
+    
+    Args:
+        history_days: days of history to keep (None for all)
+        max_points: target number of points (None to keep every day)
+    """
+    dates = np.asarray(forecast["dates"])
+    start = 0
+    low_balance_dates = forecast["low_balance_dates"]
+    if history_days is not None and len(dates):
+        cutoff = (datetime.now().date() - timedelta(days=history_days)).isoformat()
+        start = int(np.searchsorted(dates, cutoff))
+        low_balance_dates = [date for date in low_balance_dates if date >= cutoff]
+    
+    indices = np.arange(start, len(dates))
+    if max_points is not None:
+        indices = start + downsample_indices(forecast["predicted_balance"][start:], max_points)
+    
+    shaped = dict(forecast)
+    shaped["dates"] = dates[indices].tolist()
+    for key in SERIES_KEYS:
+        if forecast.get(key) is not None:
+            shaped[key] = np.asarray(forecast[key])[indices].tolist()
+    shaped["low_balance_dates"] = low_balance_dates
+    return shaped
+
 def calculate_average_monthly_income(user_id: int, db: Session) -> float:
     """Calculate average monthly income from credit transactions"""
     # Get last 3 months of credit transactions
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+KEYWORD_RULES_PATH = os.getenv(
+    "KEYWORD_RULES_PATH", str(Path(__file__).resolve().parent / "keyword_rules.json")
+)
+
+def _trie_pattern(keywords) -> str:
+    """
+    Regex for a set of literal keywords with shared prefixes factored out.
+
+    Optional suffixes are greedy, so at any position the pattern matches the
+    longest keyword starting there.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        ends_here = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if ends_here:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+class KeywordMatcher:
+    """
+    Finds the highest-priority keyword contained in a text in one scan.
+
+    Keywords are matched as case-insensitive substrings; a keyword's priority
+    is its position in the list. All keywords are compiled into one trie
+    regex inside a lookahead, so every start position is tried once and the
+    cost per text depends on its length, not on the number of keywords.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = []
+        rank = {}
+        for keyword in keywords:
+            keyword = keyword.upper()
+            if keyword and keyword not in rank:
+                rank[keyword] = len(self.keywords)
+                self.keywords.append(keyword)
+
+        # The longest keyword at a position also stands for every shorter
+        # keyword that is a prefix of it
+        self._best_rank = {
+            keyword: min(rank[keyword[:n]] for n in range(1, len(keyword) + 1) if keyword[:n] in rank)
+            for keyword in self.keywords
+        }
+        self._pattern = re.compile("(?=(" + _trie_pattern(self.keywords) + "))") if self.keywords else None
+
+    def first_match(self, text: str) -> Optional[int]:
+        """Index of the highest-priority keyword found in text, or None"""
+        if self._pattern is None or not text:
+            return None
+        best = None
+        for match in self._pattern.finditer(text.upper()):
+            rank = self._best_rank[match.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if best == 0:
+                    break
+        return best
+
+class KeywordRules:
+    """Category and subscription-name rules loaded from a JSON file"""
+
+    def __init__(self, rules: dict):
+        # Identifies the rule set results were computed with
+        self.version = hashlib.sha1(json.dumps(rules, sort_keys=True).encode("utf-8")).hexdigest()
+        keywords, labels = [], []
+        for rule in rules["categories"]:
+            for keyword in rule["keywords"]:
+                keywords.append(keyword)
+                labels.append(rule["category"])
+        self.default_category = rules.get("default_category", "Other")
+        self._category_matcher = KeywordMatcher(keywords)
+        # Duplicate keywords keep the label of their first (highest-priority) rule
+        first_label = {}
+        for keyword, label in zip(keywords, labels):
+            first_label.setdefault(keyword.upper(), label)
+        self._category_labels = [first_label[keyword] for keyword in self._category_matcher.keywords]
+        self._name_matcher = KeywordMatcher(rules.get("subscription_names", []))
+
+    @classmethod
+    def load(cls, path: str = KEYWORD_RULES_PATH):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def category(self, description: str) -> str:
+        """Category of the first rule, in file order, with a keyword in description"""
+        index = self._category_matcher.first_match(description)
+        return self.default_category if index is None else self._category_labels[index]
+
+    def subscription_keyword(self, description: str) -> Optional[str]:
+        """First subscription-name keyword, in file order, found in description"""
+        index = self._name_matcher.first_match(description)
+        return None if index is None else self._name_matcher.keywords[index]
+
+_rules = None
+_rules_lock = threading.Lock()
+
+def get_keyword_rules() -> KeywordRules:
+    """Rules compiled from KEYWORD_RULES_PATH on first use"""
+    global _rules
+    if _rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = KeywordRules.load(KEYWORD_RULES_PATH)
+    return _rules
@@ -0,0 +1,314 @@
+"""
+Versioned on-disk format for the linear text categorizers.
+
+An artifact is a directory holding a JSON manifest plus one .npy file per
+numeric array (coefficients, intercepts, IDF weights). Arrays are opened
+with np.load(mmap_mode='r'), so every uvicorn worker maps the same page-cache
+copy instead of unpickling its own. The vocabulary, if any, is stored as a
+JSON list in feature-index order.
+
+The configured path is a symlink to the current version directory
+(`<name>.v<timestamp>-<pid>` next to it). Saving writes a new version and
+swaps the symlink with a rename, so the path always names a complete
+artifact; the previous version is kept for readers still loading it.
+
+Compare load times of a legacy pickle and an artifact, or convert one:
+
+    cd backend
+    python -m ml.model_artifact benchmark categorizer_model
+    python -m ml.model_artifact convert categorizer_model.pkl categorizer_model
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+# Bumped whenever the layout changes; newer artifacts are refused, not misread
+ARTIFACT_FORMAT = "subscription-guardian/linear-text-model"
+ARTIFACT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+VOCABULARY_FILE = "vocabulary.json"
+
+# Loads retried when a save replaced the version being read
+LOAD_ATTEMPTS = 3
+
+# Vectorizer settings recorded in the manifest; everything else uses defaults
+_TEXT_PARAMS = ["analyzer", "ngram_range", "lowercase", "token_pattern", "strip_accents", "stop_words", "binary"]
+_TFIDF_PARAMS = _TEXT_PARAMS + ["norm", "use_idf", "sublinear_tf"]
+_HASHING_PARAMS = _TEXT_PARAMS + ["n_features", "alternate_sign", "norm"]
+
+class ModelArtifactError(ValueError):
+    """Raised for a missing, malformed or incompatible model artifact"""
+    pass
+
+def is_artifact(path) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+def _vectorizer_params(vectorizer, names) -> dict:
+    params = vectorizer.get_params()
+    return {
+        name: list(params[name]) if isinstance(params[name], tuple) else params[name]
+        for name in names
+    }
+
+def save_artifact(path, vectorizer, model, extra=None):
+    """
+    Write a fitted TfidfVectorizer or HashingVectorizer and a linear
+    classifier (LogisticRegression, SGDClassifier) as an artifact directory
+
+    The artifact is written to a new version directory next to `path` and
+    published by swapping the `path` symlink, so readers never see a
+    missing or partially written artifact.
+
+    Args:
+        extra: optional JSON-serializable dict stored in the manifest
+    """
+    if isinstance(vectorizer, HashingVectorizer):
+        kind = "hashing"
+        params = _vectorizer_params(vectorizer, _HASHING_PARAMS)
+    elif isinstance(vectorizer, TfidfVectorizer):
+        kind = "tfidf"
+        params = _vectorizer_params(vectorizer, _TFIDF_PARAMS)
+    else:
+        raise ModelArtifactError(f"Unsupported vectorizer: {type(vectorizer).__name__}")
+
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+
+    np.save(tmp_path / "coef.npy", np.ascontiguousarray(model.coef_, dtype=np.float64))
+    np.save(tmp_path / "intercept.npy", np.ascontiguousarray(model.intercept_, dtype=np.float64))
+    if kind == "tfidf":
+        if params["use_idf"]:
+            np.save(tmp_path / "idf.npy", np.ascontiguousarray(vectorizer.idf_, dtype=np.float64))
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, index in vectorizer.vocabulary_.items():
+            terms[index] = term
+        with open(tmp_path / VOCABULARY_FILE, "w") as f:
+            json.dump(terms, f)
+
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "vectorizer": kind,
+        "vectorizer_params": params,
+        "model": type(model).__name__,
+        "classes": [str(c) for c in model.classes_],
+        "n_features": int(model.coef_.shape[1]),
+        "created_at": time.time(),
+        "extra": extra or {}
+    }
+    with open(tmp_path / MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    version_path = path.with_name(f"{path.name}.v{time.time_ns():020d}-{os.getpid()}")
+    os.replace(tmp_path, version_path)
+    _publish(path, version_path)
+
+def _publish(path: Path, version_path: Path):
+    """Point the `path` symlink at `version_path` and prune older versions"""
+    link_path = path.with_name(f"{path.name}.link-{os.getpid()}")
+    if link_path.is_symlink():
+        link_path.unlink()
+    try:
+        link_path.symlink_to(version_path.name, target_is_directory=True)
+    except OSError:
+        # No symlink privilege (Windows): swap the directories instead, which
+        # leaves `path` missing for a moment
+        old_path = path.with_name(f"{path.name}.old-{os.getpid()}")
+        if path.exists():
+            os.replace(path, old_path)
+        os.replace(version_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return
+
+    previous = path.resolve() if path.is_symlink() else None
+    if path.exists() and not path.is_symlink():
+        # Artifact written before versioned directories: move it aside once
+        legacy_path = path.with_name(f"{path.name}.v{0:020d}-legacy")
+        shutil.rmtree(legacy_path, ignore_errors=True)
+        os.replace(path, legacy_path)
+        previous = legacy_path
+    os.replace(link_path, path)
+
+    # Versions older than the one just replaced are no longer read by anyone
+    if previous is not None:
+        for old_version in path.parent.glob(f"{path.name}.v*"):
+            if old_version.name < previous.name and old_version.is_dir() and not old_version.is_symlink():
+                shutil.rmtree(old_version, ignore_errors=True)
+
+def read_manifest(path) -> dict:
+    """Read and validate an artifact's manifest"""
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ModelArtifactError(f"Cannot read model artifact at {path}: {e}")
+
+    if manifest.get("format") != ARTIFACT_FORMAT:
+        raise ModelArtifactError(f"{path} is not a categorizer model artifact")
+    if manifest.get("version") != ARTIFACT_VERSION:
+        raise ModelArtifactError(
+            f"Model artifact version {manifest.get('version')} is not supported "
+            f"(expected {ARTIFACT_VERSION})"
+        )
+    return manifest
+
+class LinearTextModel:
+    """
+    Read-only categorizer backed by a memory-mapped artifact
+
+    Predictions are computed directly from the arrays: features from a
+    fixed-vocabulary CountVectorizer (or a HashingVectorizer), TF-IDF
+    weighting and normalization, then argmax of X @ coef.T + intercept.
+    """
+
+    def __init__(self, path, mmap: bool = True):
+        # Every file is read from one resolved version. A save may publish
+        # and prune versions while this one loads; then load the new one.
+        for attempt in range(LOAD_ATTEMPTS):
+            version_path = os.path.realpath(path)
+            try:
+                self._load(version_path, mmap)
+                return
+            except (OSError, ModelArtifactError):
+                if attempt == LOAD_ATTEMPTS - 1 or os.path.realpath(path) == version_path:
+                    raise
+
+    def _load(self, path, mmap: bool):
+        self.path = path
+        self.manifest = read_manifest(path)
+        mode = "r" if mmap else None
+
+        def array(name):
+            return np.load(os.path.join(path, name), mmap_mode=mode)
+
+        self.coef = array("coef.npy")
+        self.intercept = array("intercept.npy")
+        self.classes = np.array(self.manifest["classes"], dtype=object)
+        params = dict(self.manifest["vectorizer_params"])
+        params["ngram_range"] = tuple(params["ngram_range"])
+
+        if self.manifest["vectorizer"] == "hashing":
+            self.vectorizer = HashingVectorizer(**params)
+            self.idf = None
+            self.norm = None
+        else:
+            self.norm = params.pop("norm")
+            self.use_idf = params.pop("use_idf")
+            self.sublinear_tf = params.pop("sublinear_tf")
+            with open(os.path.join(path, VOCABULARY_FILE)) as f:
+                terms = json.load(f)
+            self.vectorizer = CountVectorizer(vocabulary={term: i for i, term in enumerate(terms)}, **params)
+            self.idf = array("idf.npy") if self.use_idf else None
+
+        if self.coef.shape != (len(self.classes) if len(self.classes) > 2 else 1, self.manifest["n_features"]):
+            raise ModelArtifactError(f"Coefficient shape {self.coef.shape} does not match the manifest")
+
+    def transform(self, descriptions):
+        X = self.vectorizer.transform(descriptions)
+        if self.manifest["vectorizer"] == "hashing":
+            return X
+        X = X.astype(np.float64)
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.idf is not None:
+            X = X @ sparse.diags(np.asarray(self.idf))
+        if self.norm:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X
+
+    def decision_function(self, descriptions):
+        return np.asarray(self.transform(descriptions) @ self.coef.T) + self.intercept
+
+    def predict_batch(self, descriptions) -> list:
+        if not descriptions:
+            return []
+        scores = self.decision_function(descriptions)
+        if scores.shape[1] == 1:
+            indices = (scores[:, 0] > 0).astype(int)
+        else:
+            indices = scores.argmax(axis=1)
+        return self.classes[indices].tolist()
+
+def convert_pickle(pickle_path, artifact_path):
+    """Convert a legacy {'vectorizer', 'model'} pickle into an artifact"""
+    with open(pickle_path, "rb") as f:
+        data = pickle.load(f)
+    save_artifact(artifact_path, data["vectorizer"], data["model"])
+
+def benchmark(artifact_path, pickle_path=None, repeat: int = 5) -> dict:
+    """
+    Time loading the artifact (and optionally a legacy pickle) plus a first
+    prediction, the work a worker does on its first categorization
+
+    Returns: {label: best seconds over `repeat` runs}
+    """
+    timings = {}
+
+    def run(label, load):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model = load()
+            model.predict_batch(["NETFLIX SUBSCRIPTION"])
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best
+
+    run("artifact (mmap)", lambda: LinearTextModel(artifact_path))
+    run("artifact (read)", lambda: LinearTextModel(artifact_path, mmap=False))
+    if pickle_path:
+        from ml.categorizer import TransactionCategorizer
+
+        def load_pickle():
+            categorizer = TransactionCategorizer()
+            with open(pickle_path, "rb") as f:
+                data = pickle.load(f)
+            categorizer.vectorizer = data["vectorizer"]
+            categorizer.model = data["model"]
+            categorizer.is_trained = True
+            return categorizer
+
+        run("pickle", load_pickle)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, convert and benchmark categorizer artifacts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="Convert a legacy pickle into an artifact")
+    convert.add_argument("pickle_path")
+    convert.add_argument("artifact_path")
+    bench = commands.add_parser("benchmark", help="Time load + first prediction")
+    bench.add_argument("artifact_path")
+    bench.add_argument("--pickle", dest="pickle_path")
+    bench.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_pickle(args.pickle_path, args.artifact_path)
+        print(f"✅ Wrote {args.artifact_path}")
+        return
+
+    manifest = read_manifest(args.artifact_path)
+    print(f"{manifest['model']} on {manifest['vectorizer']} features: "
+          f"{len(manifest['classes'])} classes x {manifest['n_features']} features")
+    for label, seconds in benchmark(args.artifact_path, args.pickle_path, args.repeat).items():
+        print(f"{label:>16}: {seconds * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    # Allow running as a script from the backend directory
+    backend_dir = Path(__file__).resolve().parent.parent
+    if str(backend_dir) not in sys.path:
+        sys.path.insert(0, str(backend_dir))
+    main()
@@ -0,0 +1,161 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Billing cycles scored for every group:
+# (frequency, step in days, min interval, max interval, charges per month)
+PERIODS = [
+    ("weekly", 7, 6, 8, 4.33),
+    ("biweekly", 14, 13, 15, 2.165),
+    ("monthly", 30, 25, 35, 1.0),
+    ("quarterly", 90, 85, 95, 1 / 3),
+    ("semiannual", 182, 175, 190, 1 / 6),
+    ("yearly", 365, 355, 375, 1 / 12),
+]
+
+# Share of a group's intervals that must fall in one cycle's window
+MIN_INTERVAL_SHARE = 0.7
+
+# Regular intervals outside the named cycles become "every_<n>_days" when
+# their coefficient of variation is below this, within these bounds
+CUSTOM_MAX_VARIATION = 0.1
+CUSTOM_MIN_DAYS = 10
+CUSTOM_MAX_DAYS = 400
+CUSTOM_MIN_OCCURRENCES = 4
+
+_CUSTOM_RE = re.compile(r"^every_(\d+)_days$")
+_SECONDS_PER_DAY = 86400
+_PERIOD_BY_NAME = {name: (step, per_month) for name, step, _, _, per_month in PERIODS}
+
+def period_days(frequency):
+    """Days between charges for a frequency value, or None if unknown"""
+    if frequency in _PERIOD_BY_NAME:
+        return _PERIOD_BY_NAME[frequency][0]
+    match = _CUSTOM_RE.match(frequency or "")
+    return int(match.group(1)) if match else None
+
+def charges_per_month(frequency) -> float:
+    """Average number of charges per month for a frequency value"""
+    if frequency in _PERIOD_BY_NAME:
+        return _PERIOD_BY_NAME[frequency][1]
+    days = period_days(frequency)
+    return 30.44 / days if days else 0.0
+
+def _flatten(date_groups):
+    """
+    Sort every group's dates and lay them out in one array.
+
+    Returns (seconds since epoch, group index per date, dates per group).
+    """
+    counts = np.array([len(dates) for dates in date_groups], dtype=np.int64)
+    if counts.sum() == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), counts
+    seconds = pd.to_datetime(
+        [date for dates in date_groups for date in dates]
+    ).as_unit('s').asi8
+    owner = np.repeat(np.arange(len(date_groups)), counts)
+    order = np.lexsort((seconds, owner))
+    return seconds[order], owner[order], counts
+
+def estimate_periods(date_groups, min_occurrences=3):
+    """
+    Score every candidate billing cycle for many groups in one pass.
+
+    Intervals between consecutive charges (whole days, like timedelta.days)
+    are binned against each cycle's window with bincount over the flattened
+    groups. A group is periodic when at least MIN_INTERVAL_SHARE of its
+    intervals fall in one window; confidence is 1 - CV of those intervals,
+    floored at 0.6. Groups without a named cycle but with very regular
+    intervals get a custom "every_<n>_days" period.
+
+    Args:
+        date_groups: list of lists of datetimes, one list per group
+
+    Returns:
+        list of dicts with is_periodic, frequency, period_days, phase
+        (days into the cycle of the last charge, counted from the epoch)
+        and confidence
+    """
+    n_groups = len(date_groups)
+    if n_groups == 0:
+        return []
+    seconds, owner, counts = _flatten(date_groups)
+
+    # Intervals within each group, in days
+    same_group = owner[1:] == owner[:-1]
+    intervals = ((seconds[1:] - seconds[:-1]) // _SECONDS_PER_DAY)[same_group].astype(float)
+    interval_owner = owner[1:][same_group]
+    n_intervals = np.bincount(interval_owner, minlength=n_groups).astype(float)
+
+    # Per-cycle count, sum and sum of squares of in-window intervals: [groups, cycles]
+    lows = np.array([p[2] for p in PERIODS], dtype=float)
+    highs = np.array([p[3] for p in PERIODS], dtype=float)
+    in_window = (intervals[:, None] >= lows) & (intervals[:, None] <= highs)
+    flat_owner = np.repeat(interval_owner, len(PERIODS)) * len(PERIODS) + np.tile(np.arange(len(PERIODS)), len(intervals))
+    size = n_groups * len(PERIODS)
+    weights = in_window.ravel().astype(float)
+    values = np.repeat(intervals, len(PERIODS)) * weights
+    hits = np.bincount(flat_owner, weights=weights, minlength=size).reshape(n_groups, -1)
+    sums = np.bincount(flat_owner, weights=values, minlength=size).reshape(n_groups, -1)
+    squares = np.bincount(flat_owner, weights=values * values, minlength=size).reshape(n_groups, -1)
+
+    best = hits.argmax(axis=1)
+    rows = np.arange(n_groups)
+    best_hits = hits[rows, best]
+    eligible = (counts >= min_occurrences) & (n_intervals > 0)
+    periodic = eligible & (best_hits > 0) & (best_hits >= n_intervals * MIN_INTERVAL_SHARE)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sums[rows, best] / best_hits
+        std = np.sqrt(np.maximum(squares[rows, best] / best_hits - mean ** 2, 0.0))
+        confidence = np.where(mean > 0, 1.0 - np.minimum(std / mean, 1.0), 0.5)
+    confidence = np.maximum(confidence, 0.6)
+
+    # Regular cycles outside the named windows
+    all_sums = np.bincount(interval_owner, weights=intervals, minlength=n_groups)
+    all_squares = np.bincount(interval_owner, weights=intervals * intervals, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        all_mean = all_sums / n_intervals
+        all_std = np.sqrt(np.maximum(all_squares / n_intervals - all_mean ** 2, 0.0))
+        variation = all_std / all_mean
+    custom = (
+        eligible & ~periodic
+        & (counts >= CUSTOM_MIN_OCCURRENCES)
+        & (all_mean >= CUSTOM_MIN_DAYS) & (all_mean <= CUSTOM_MAX_DAYS)
+        & (variation < CUSTOM_MAX_VARIATION)
+    )
+
+    steps = np.array([p[1] for p in PERIODS], dtype=float)[best]
+    steps = np.where(custom, np.round(np.nan_to_num(all_mean)), steps)
+    confidence = np.where(custom, np.maximum(1.0 - np.nan_to_num(variation), 0.6), confidence)
+
+    # Last charge of each group, in days since the epoch
+    last_index = np.cumsum(counts) - 1
+    last_day = np.zeros(n_groups)
+    has_dates = counts > 0
+    last_day[has_dates] = seconds[last_index[has_dates]] / _SECONDS_PER_DAY
+    phase = np.mod(last_day, np.where(steps > 0, steps, 1.0))
+
+    results = []
+    for g in range(n_groups):
+        if periodic[g]:
+            frequency = PERIODS[best[g]][0]
+        elif custom[g]:
+            frequency = f"every_{int(steps[g])}_days"
+        else:
+            results.append({
+                "is_periodic": False,
+                "frequency": None,
+                "period_days": None,
+                "phase": None,
+                "confidence": 0.0
+            })
+            continue
+        results.append({
+            "is_periodic": True,
+            "frequency": frequency,
+            "period_days": int(steps[g]),
+            "phase": float(phase[g]),
+            "confidence": float(confidence[g])
+        })
+    return results
@@ -1,190 +1,438 @@
-import pandas as pd
+import re
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import timedelta
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from fuzzywuzzy import fuzz
+from rapidfuzz import fuzz, process
 from collections import defaultdict
 
-from app.models import Transaction, Subscription
+from app.models import Transaction, Subscription, MerchantGroup, Merchant
+from app.data_version import bump_data_version
+from ml.period_engine import estimate_periods, charges_per_month
+from ml.keyword_matcher import get_keyword_rules
+
+# Grouping threshold: fuzzywuzzy's integer ratio > 80, i.e. a raw ratio above 80.5
+SIMILARITY_THRESHOLD = 80
+SIMILARITY_CUTOFF = SIMILARITY_THRESHOLD + 0.5
+
+# Up to this many distinct descriptions share one block, so every seed is
+# scored against all unclaimed descriptions exactly like the pairwise scan;
+# above it candidates are blocked by key
+EXACT_SCAN_LIMIT = 1000
+
+# New descriptions scored against existing group seeds per cdist call
+MATCH_BATCH_ROWS = 512
+
+_TOKEN_RE = re.compile(r"[a-z0-9]{3,}")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+
+def normalize_description(description: str) -> str:
+    """Case-folded form of a description used for similarity scoring"""
+    return description.lower().strip()
+
+def _blocking_keys(normalized: str, merchant_id=None):
+    """
+    Candidate keys for a description: its merchant id, the first 3 chars of
+    each alphanumeric token, plus the first and last 4 chars of the
+    alphanumeric form. Descriptions similar enough to group almost always
+    share one of them.
+    """
+    keys = {"t:" + token[:3] for token in _TOKEN_RE.findall(normalized)}
+    if merchant_id is not None:
+        keys.add(f"m:{merchant_id}")
+    compact = _NON_ALNUM_RE.sub("", normalized)
+    keys.add("p:" + compact[:4])
+    keys.add("s:" + compact[-4:])
+    return keys
+
+def _cluster_descriptions(strings, merchant_ids=None):
+    """
+    Greedily cluster distinct normalized descriptions in order.
+
+    Each unclaimed description becomes a seed and claims every later
+    unclaimed description in its blocks whose similarity exceeds the
+    threshold. Candidates are scored in one rapidfuzz cdist call per seed,
+    and claimed descriptions are pruned from the blocks as they go.
+
+    Args:
+        merchant_ids: optional merchant id per description, used as an extra
+            blocking key so descriptions of one merchant are always compared
+
+    Returns: list of clusters, each a list of indices into `strings`
+    """
+    n = len(strings)
+    if n <= EXACT_SCAN_LIMIT:
+        keys_of = [("all",)] * n
+    else:
+        merchant_ids = merchant_ids or [None] * n
+        keys_of = [tuple(_blocking_keys(text, m)) for text, m in zip(strings, merchant_ids)]
+
+    block_lists = defaultdict(list)
+    for i, keys in enumerate(keys_of):
+        for key in keys:
+            block_lists[key].append(i)
+    blocks = {key: np.asarray(members, dtype=np.int64) for key, members in block_lists.items()}
+
+    claimed = np.zeros(n, dtype=bool)
+    clusters = []
+    for seed in range(n):
+        if claimed[seed]:
+            continue
+        claimed[seed] = True
+
+        candidates = []
+        for key in keys_of[seed]:
+            members = blocks[key]
+            members = members[~claimed[members]]
+            blocks[key] = members
+            candidates.append(members)
+        candidates = np.unique(np.concatenate(candidates)) if len(candidates) > 1 else candidates[0]
+
+        hits = candidates[:0]
+        if len(candidates):
+            scores = process.cdist(
+                [strings[seed]],
+                [strings[i] for i in candidates],
+                scorer=fuzz.ratio,
+                score_cutoff=SIMILARITY_CUTOFF
+            )[0]
+            hits = candidates[scores > SIMILARITY_CUTOFF]
+            claimed[hits] = True
+
+        clusters.append([seed, *hits.tolist()])
+
+    return clusters
 
 def group_similar_transactions(transactions):
     """
     Group transactions with similar descriptions using fuzzy matching
     Returns: dict of {group_key: [transactions]}
+
+    Identical descriptions are collapsed first, so each distinct description
+    is scored once. Groups are formed greedily in order of first appearance,
+    which reproduces the pairwise scan over every transaction.
     """
+    order = {id(trans): position for position, trans in enumerate(transactions)}
+
+    # Distinct normalized descriptions in order of first appearance
+    index_of = {}
+    members = []
+    for trans in transactions:
+        text = normalize_description(trans.description)
+        if text not in index_of:
+            index_of[text] = len(members)
+            members.append([])
+        members[index_of[text]].append(trans)
+
     groups = defaultdict(list)
-    processed = set()
-    
-    for i, trans in enumerate(transactions):
-        if i in processed:
-            continue
-        
-        # Start a new group
-        group_key = trans.description[:30]  # Use first 30 chars as key
-        groups[group_key].append(trans)
-        processed.add(i)
-        
-        # Find similar transactions
-        for j, other_trans in enumerate(transactions[i+1:], start=i+1):
-            if j in processed:
-                continue
-            
-            # Use fuzzy string matching
-            similarity = fuzz.ratio(trans.description.lower(), other_trans.description.lower())
-            
-            # If very similar descriptions, group them
-            if similarity > 80:
-                groups[group_key].append(other_trans)
-                processed.add(j)
-    
+    for cluster in _cluster_descriptions(list(index_of)):
+        seed = cluster[0]
+        group_key = members[seed][0].description[:30]  # Use first 30 chars as key
+        # Keep transactions in their original order within the group
+        grouped = sorted(
+            (t for idx in cluster for t in members[idx]),
+            key=lambda t: order[id(t)]
+        )
+        groups[group_key].extend(grouped)
+
     return groups
 
 def detect_periodicity(transaction_dates, min_occurrences=3):
     """
     Detect if transactions occur at regular intervals
     Returns: (is_periodic, frequency, confidence)
+
+    Single-group wrapper around ml.period_engine.estimate_periods.
     """
-    if len(transaction_dates) < min_occurrences:
-        return False, None, 0.0
-    
-    # Sort dates
-    dates = sorted(transaction_dates)
-    
-    # Calculate intervals between consecutive transactions (in days)
-    intervals = [(dates[i+1] - dates[i]).days for i in range(len(dates)-1)]
-    
-    if not intervals:
-        return False, None, 0.0
-    
-    # Check for monthly pattern (28-31 days)
-    monthly_intervals = [i for i in intervals if 25 <= i <= 35]
-    if len(monthly_intervals) >= len(intervals) * 0.7:  # 70% of intervals are monthly
-        avg_interval = np.mean(monthly_intervals)
-        std_interval = np.std(monthly_intervals) if len(monthly_intervals) > 1 else 0
-        confidence = 1.0 - min(std_interval / avg_interval, 1.0) if avg_interval > 0 else 0.5
-        return True, "monthly", max(confidence, 0.6)
-    
-    # Check for weekly pattern (6-8 days)
-    weekly_intervals = [i for i in intervals if 6 <= i <= 8]
-    if len(weekly_intervals) >= len(intervals) * 0.7:
-        avg_interval = np.mean(weekly_intervals)
-        std_interval = np.std(weekly_intervals) if len(weekly_intervals) > 1 else 0
-        confidence = 1.0 - min(std_interval / avg_interval, 1.0) if avg_interval > 0 else 0.5
-        return True, "weekly", max(confidence, 0.6)
-    
-    # Check for quarterly pattern (88-95 days)
-    quarterly_intervals = [i for i in intervals if 85 <= i <= 95]
-    if len(quarterly_intervals) >= len(intervals) * 0.7:
-        avg_interval = np.mean(quarterly_intervals)
-        std_interval = np.std(quarterly_intervals) if len(quarterly_intervals) > 1 else 0
-        confidence = 1.0 - min(std_interval / avg_interval, 1.0) if avg_interval > 0 else 0.5
-        return True, "quarterly", max(confidence, 0.6)
-    
-    return False, None, 0.0
+    estimate = estimate_periods([list(transaction_dates)], min_occurrences)[0]
+    return estimate["is_periodic"], estimate["frequency"], estimate["confidence"]
 
 def extract_subscription_name(description):
     """Extract a clean subscription name from transaction description"""
-    # Common patterns to clean
-    description = description.upper()
-    
-    # Known subscription keywords
-    streaming = ['NETFLIX', 'SPOTIFY', 'PRIME', 'AMAZON PRIME', 'DISNEY', 'HBO', 'APPLE MUSIC']
-    gym = ['GYM', 'FITNESS', 'PLANET FITNESS', 'GOLD\'S GYM']
-    utilities = ['ELECTRICITY', 'WATER', 'GAS', 'INTERNET', 'MOBILE']
-    
-    for keyword in streaming + gym + utilities:
-        if keyword in description:
-            return keyword.title()
+    # Known subscription keywords, matched in rule-file order
+    keyword = get_keyword_rules().subscription_keyword(description)
+    if keyword:
+        return keyword.title()
     
     # Otherwise, take first 3 words
     words = description.split()
     return ' '.join(words[:3]).title()
 
-def detect_subscriptions(user_id: int, db: Session):
+def _first_matching_group(strings, seeds):
     """
-    Main function to detect recurring subscriptions from transactions
+    For each description return the index of the first seed (in group order)
+    it matches above the threshold, or -1. Scored with cdist in row batches.
+    """
+    matches = np.full(len(strings), -1, dtype=np.int64)
+    if not seeds:
+        return matches
+    for start in range(0, len(strings), MATCH_BATCH_ROWS):
+        scores = process.cdist(
+            strings[start:start + MATCH_BATCH_ROWS],
+            seeds,
+            scorer=fuzz.ratio,
+            score_cutoff=SIMILARITY_CUTOFF,
+            workers=-1
+        )
+        hit = scores > SIMILARITY_CUTOFF
+        first = hit.argmax(axis=1)
+        matches[start:start + len(first)] = np.where(hit.any(axis=1), first, -1)
+    return matches
+
+def assign_transaction_groups(user_id: int, db: Session):
     """
-    # Get all user transactions
-    transactions = db.query(Transaction).filter(
+    Assign the user's ungrouped debits to merchant groups
+
+    A new description joins the first existing group whose seed it matches;
+    the rest are clustered among themselves and start new groups. Because
+    existing groups were seeded earlier, this gives the same groups as
+    regrouping the whole history.
+
+    Returns: set of ids of groups that received transactions
+    """
+    new_transactions = db.query(Transaction.id, Transaction.description, Transaction.merchant_id).filter(
         Transaction.user_id == user_id,
-        Transaction.amount < 0  # Only debits (expenses)
-    ).all()
-    
-    if len(transactions) < 3:
+        Transaction.amount < 0,  # Only debits (expenses)
+        Transaction.group_id.is_(None)
+    ).order_by(Transaction.id).all()
+
+    if not new_transactions:
+        return set()
+
+    # Distinct normalized descriptions in order of first appearance
+    index_of = {}
+    members = []
+    for trans in new_transactions:
+        text = normalize_description(trans.description)
+        if text not in index_of:
+            index_of[text] = len(members)
+            members.append([])
+        members[index_of[text]].append(trans)
+    strings = list(index_of)
+
+    groups = db.query(MerchantGroup).filter(
+        MerchantGroup.user_id == user_id
+    ).order_by(MerchantGroup.id).all()
+
+    matches = _first_matching_group(strings, [g.normalized_description for g in groups])
+    assigned = [groups[m] if m >= 0 else None for m in matches]
+
+    unmatched = [i for i, group in enumerate(assigned) if group is None]
+    clusters = _cluster_descriptions(
+        [strings[i] for i in unmatched],
+        [members[i][0].merchant_id for i in unmatched]
+    )
+    for cluster in clusters:
+        seed = unmatched[cluster[0]]
+        seed_transaction = members[seed][0]
+        group = MerchantGroup(
+            user_id=user_id,
+            key=seed_transaction.description[:30],
+            description=seed_transaction.description,
+            normalized_description=strings[seed],
+            merchant_id=seed_transaction.merchant_id
+        )
+        db.add(group)
+        for idx in cluster:
+            assigned[unmatched[idx]] = group
+    db.flush()
+
+    db.execute(update(Transaction), [
+        {"id": trans.id, "group_id": group.id}
+        for group, same_description in zip(assigned, members)
+        for trans in same_description
+    ])
+
+    return {group.id for group in assigned}
+
+def refresh_groups(groups, db: Session):
+    """
+    Recompute interval stats and periodicity for merchant groups and upsert
+    their subscriptions
+
+    Periodicity of all groups is scored in one estimate_periods pass, and
+    subscriptions are upserted in bulk: existing ones are loaded with one
+    query for all users involved and new ones are flushed together.
+
+    Returns: list of newly created Subscriptions
+    """
+    if not groups:
         return []
-    
-    # Group similar transactions
-    groups = group_similar_transactions(transactions)
-    
-    detected_subscriptions = []
-    
-    for group_key, group_transactions in groups.items():
-        if len(group_transactions) < 3:
+
+    rows = db.query(Transaction.group_id, Transaction.date, Transaction.amount).filter(
+        Transaction.group_id.in_([g.id for g in groups])
+    ).all()
+
+    # Get dates and amounts per group
+    dates_by_group = defaultdict(list)
+    amounts_by_group = defaultdict(list)
+    for row in rows:
+        dates_by_group[row.group_id].append(row.date)
+        amounts_by_group[row.group_id].append(abs(row.amount))
+
+    estimates = estimate_periods([dates_by_group[g.id] for g in groups])
+
+    periodic = []
+    for group, estimate in zip(groups, estimates):
+        dates = sorted(dates_by_group[group.id])
+        amounts = amounts_by_group[group.id]
+
+        intervals = [(dates[i+1] - dates[i]).days for i in range(len(dates)-1)]
+        group.transaction_count = len(dates)
+        group.avg_amount = float(np.mean(amounts)) if amounts else 0.0
+        group.mean_interval = float(np.mean(intervals)) if intervals else None
+        group.std_interval = float(np.std(intervals)) if intervals else None
+        group.last_seen_date = dates[-1] if dates else None
+        group.is_periodic = False
+
+        if len(dates) < 3:
             continue
-        
-        # Get dates and amounts
-        dates = [t.date for t in group_transactions]
-        amounts = [abs(t.amount) for t in group_transactions]
-        
+
         # Check if amounts are similar (within 10%)
-        avg_amount = np.mean(amounts)
+        avg_amount = group.avg_amount
         amount_variation = np.std(amounts) / avg_amount if avg_amount > 0 else 1.0
-        
+
         if amount_variation > 0.15:  # More than 15% variation
             continue
-        
-        # Detect periodicity
-        is_periodic, frequency, confidence = detect_periodicity(dates)
-        
-        if is_periodic and confidence > 0.5:
-            # Extract subscription name
-            subscription_name = extract_subscription_name(group_transactions[0].description)
-            
-            # Calculate next payment date
-            last_date = max(dates)
-            if frequency == "monthly":
-                next_payment = last_date + timedelta(days=30)
-            elif frequency == "weekly":
-                next_payment = last_date + timedelta(days=7)
-            elif frequency == "quarterly":
-                next_payment = last_date + timedelta(days=90)
-            else:
-                next_payment = None
-            
-            # Check if subscription already exists
-            existing_sub = db.query(Subscription).filter(
-                Subscription.user_id == user_id,
-                Subscription.name == subscription_name
-            ).first()
-            
-            if existing_sub:
-                # Update existing subscription
-                existing_sub.amount = avg_amount
-                existing_sub.frequency = frequency
-                existing_sub.confidence_score = confidence
-                existing_sub.last_payment_date = last_date
-                existing_sub.next_payment_date = next_payment
-            else:
-                # Create new subscription
-                subscription = Subscription(
-                    user_id=user_id,
-                    name=subscription_name,
-                    amount=avg_amount,
-                    frequency=frequency,
-                    confidence_score=confidence,
-                    last_payment_date=last_date,
-                    next_payment_date=next_payment,
-                    status="active"
-                )
-                db.add(subscription)
-                detected_subscriptions.append(subscription)
-            
-            # Mark transactions as recurring
-            for trans in group_transactions:
-                trans.is_recurring = True
-    
+
+        if estimate["is_periodic"] and estimate["confidence"] > 0.5:
+            periodic.append((group, estimate))
+
+    return _upsert_subscriptions(periodic, db)
+
+def _upsert_subscriptions(periodic, db: Session):
+    """
+    Create or update the subscriptions of periodic groups and mark their
+    transactions as recurring
+
+    Args:
+        periodic: list of (MerchantGroup, period estimate) pairs
+
+    Returns: list of newly created Subscriptions
+    """
+    if not periodic:
+        return []
+
+    user_ids = {group.user_id for group, _ in periodic}
+    existing = {
+        (sub.user_id, sub.name): sub
+        for sub in db.query(Subscription).filter(Subscription.user_id.in_(user_ids)).all()
+    }
+    merchant_names = dict(
+        db.query(Merchant.id, Merchant.name).filter(
+            Merchant.id.in_({group.merchant_id for group, _ in periodic if group.merchant_id})
+        ).all()
+    )
+
+    created = []
+    linked = []
+    for group, estimate in periodic:
+        group.is_periodic = True
+        frequency = estimate["frequency"]
+        confidence = estimate["confidence"]
+        last_date = group.last_seen_date
+        avg_amount = group.avg_amount
+
+        # Name from the resolved merchant; older groups fall back to the description
+        subscription_name = merchant_names.get(group.merchant_id) or extract_subscription_name(group.description)
+
+        # Calculate next payment date
+        next_payment = last_date + timedelta(days=estimate["period_days"])
+
+        subscription = existing.get((group.user_id, subscription_name))
+        if subscription:
+            # Update existing subscription
+            subscription.amount = avg_amount
+            subscription.frequency = frequency
+            subscription.confidence_score = confidence
+            subscription.last_payment_date = last_date
+            subscription.next_payment_date = next_payment
+        else:
+            # Create new subscription
+            subscription = Subscription(
+                user_id=group.user_id,
+                name=subscription_name,
+                amount=avg_amount,
+                frequency=frequency,
+                confidence_score=confidence,
+                last_payment_date=last_date,
+                next_payment_date=next_payment,
+                status="active"
+            )
+            db.add(subscription)
+            existing[(group.user_id, subscription_name)] = subscription
+            created.append(subscription)
+        linked.append((group, subscription))
+
+    # Assigns ids to the new subscriptions
+    db.flush()
+    for group, subscription in linked:
+        group.subscription_id = subscription.id
+
+    # Mark transactions as recurring
+    db.query(Transaction).filter(
+        Transaction.group_id.in_([group.id for group, _ in periodic])
+    ).update({Transaction.is_recurring: True}, synchronize_session=False)
+
+    return created
+
+def reset_transaction_groups(user_id: int, db: Session):
+    """
+    Drop a user's persisted groups and recurring flags so the next detection
+    regroups everything
+    """
+    db.query(Transaction).filter(
+        Transaction.user_id == user_id
+    ).update({Transaction.group_id: None, Transaction.is_recurring: False}, synchronize_session=False)
+    db.query(MerchantGroup).filter(
+        MerchantGroup.user_id == user_id
+    ).delete(synchronize_session=False)
+
+def prune_subscriptions(user_id: int, db: Session):
+    """Delete a user's subscriptions that no merchant group is linked to"""
+    db.flush()
+    linked = select(MerchantGroup.subscription_id).where(
+        MerchantGroup.user_id == user_id,
+        MerchantGroup.subscription_id.isnot(None)
+    )
+    db.query(Subscription).filter(
+        Subscription.user_id == user_id,
+        Subscription.id.notin_(linked)
+    ).delete(synchronize_session=False)
+
+def detect_subscriptions(user_id: int, db: Session, full: bool = False):
+    """
+    Main function to detect recurring subscriptions from transactions
+
+    Only transactions not yet assigned to a merchant group are grouped, and
+    periodicity is recomputed only for the groups they joined, so the cost
+    follows the size of the new upload rather than the whole history.
+
+    Args:
+        full: discard persisted groups and re-detect from scratch, removing
+            subscriptions and recurring flags that are no longer detected
+    """
+    if full:
+        reset_transaction_groups(user_id, db)
+
+    touched = assign_transaction_groups(user_id, db)
+
+    detected_subscriptions = []
+    if touched:
+        groups = db.query(MerchantGroup).filter(
+            MerchantGroup.id.in_(touched)
+        ).order_by(MerchantGroup.id).all()
+
+        detected_subscriptions = refresh_groups(groups, db)
+
+    if full:
+        # Subscriptions whose charges no longer form a periodic group
+        prune_subscriptions(user_id, db)
+
+    if full or touched:
+        bump_data_version(user_id, db)
     db.commit()
-    
+
     return detected_subscriptions
 
 def calculate_monthly_subscription_cost(user_id: int, db: Session) -> float:
@@ -196,11 +444,7 @@ def calculate_monthly_subscription_cost(user_id: int, db: Session) -> float:
     
     total = 0.0
     for sub in subscriptions:
-        if sub.frequency == "monthly":
-            total += sub.amount
-        elif sub.frequency == "weekly":
-            total += sub.amount * 4.33  # Average weeks per month
-        elif sub.frequency == "quarterly":
-            total += sub.amount / 3
+        # e.g. weekly x4.33, quarterly /3, yearly /12
+        total += sub.amount * charges_per_month(sub.frequency)
     
     return total
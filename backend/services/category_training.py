@@ -0,0 +1,199 @@
+import logging
+import os
+import queue
+import threading
+import time
+from dotenv import load_dotenv
+
+from app.database import SessionLocal
+from app.models import MerchantAlias
+from ml.categorizer import get_categorizer, OnlineCategorizer, CATEGORIZER_MODE, ONLINE_MODEL_PATH
+from ml.keyword_matcher import get_keyword_rules
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Corrections applied per partial_fit call, and the longest a partial batch waits
+ONLINE_BATCH_SIZE = int(os.getenv("ONLINE_BATCH_SIZE", "32"))
+ONLINE_FLUSH_SECONDS = float(os.getenv("ONLINE_FLUSH_SECONDS", "5"))
+
+# The model is checkpointed at most this often, and only after it changed
+ONLINE_CHECKPOINT_SECONDS = float(os.getenv("ONLINE_CHECKPOINT_SECONDS", "300"))
+
+# Corrections waiting for the trainer; further submissions are dropped
+MAX_PENDING_CORRECTIONS = 10000
+
+# Held by the one process allowed to train and checkpoint the online model
+TRAINER_LOCK_PATH = f"{ONLINE_MODEL_PATH}.lock"
+
+_corrections = queue.Queue(maxsize=MAX_PENDING_CORRECTIONS)
+_stop = threading.Event()
+_trainer = None
+_trainer_lock = threading.Lock()
+_trainer_lock_file = None
+_stats = {
+    "batches": 0,
+    "corrections": 0,
+    "dropped": 0,
+    "last_checkpoint": None
+}
+
+def submit_correction(description: str, category: str) -> bool:
+    """
+    Queue a (description, category) pair for the online model
+
+    Never blocks the request path. Returns False if no trainer is running or
+    the queue is full.
+    """
+    if _trainer is None:
+        return False
+    try:
+        _corrections.put_nowait((description, category))
+        return True
+    except queue.Full:
+        _stats["dropped"] += 1
+        return False
+
+def _next_batch() -> list:
+    """Wait for a first correction, then collect up to ONLINE_BATCH_SIZE"""
+    try:
+        batch = [_corrections.get(timeout=ONLINE_FLUSH_SECONDS)]
+    except queue.Empty:
+        return []
+    deadline = time.monotonic() + ONLINE_FLUSH_SECONDS
+    while len(batch) < ONLINE_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or _stop.is_set():
+            break
+        try:
+            batch.append(_corrections.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+def _bootstrap(model: OnlineCategorizer):
+    """
+    Seed a model without a checkpoint from the rule-based categories of
+    merchant aliases resolved with the current keyword rules
+
+    The seed model is trained on the side and swapped in when complete, so
+    predictions never come from a half-seeded model.
+    """
+    seeded = OnlineCategorizer()
+    db = SessionLocal()
+    try:
+        rows = db.query(MerchantAlias.normalized_description, MerchantAlias.category).filter(
+            MerchantAlias.category.in_(seeded.categories),
+            MerchantAlias.rules_version == get_keyword_rules().version
+        ).yield_per(1000)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == 1000:
+                seeded.partial_fit([r[0] for r in batch], [r[1] for r in batch])
+                batch = []
+        seeded.partial_fit([r[0] for r in batch], [r[1] for r in batch])
+    finally:
+        db.close()
+    model.adopt(seeded)
+
+def _train(model: OnlineCategorizer):
+    """Trainer thread: seed a model without a checkpoint, then apply corrections"""
+    if model.samples_seen == 0:
+        try:
+            _bootstrap(model)
+        except Exception:
+            logger.exception("Seeding the online categorizer failed; training from corrections only")
+    _train_loop(model)
+
+def _train_loop(model: OnlineCategorizer):
+    last_checkpoint = time.monotonic()
+    dirty = False
+    while True:
+        batch = _next_batch()
+        if batch:
+            descriptions, labels = zip(*batch)
+            model.partial_fit(list(descriptions), list(labels))
+            _stats["batches"] += 1
+            _stats["corrections"] += len(batch)
+            dirty = True
+
+        stopping = _stop.is_set() and _corrections.empty()
+        if dirty and (stopping or time.monotonic() - last_checkpoint >= ONLINE_CHECKPOINT_SECONDS):
+            model.save_model(ONLINE_MODEL_PATH)
+            last_checkpoint = time.monotonic()
+            _stats["last_checkpoint"] = time.time()
+            dirty = False
+        if stopping:
+            return
+
+def _lock_file(f) -> bool:
+    """Take a non-blocking exclusive lock on an open file, released when it is closed"""
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def start_trainer() -> bool:
+    """
+    Start the background trainer for the process-wide online categorizer
+
+    Each process would otherwise train its own copy of the model and
+    overwrite the others' checkpoints, so the trainer runs in the one
+    process holding TRAINER_LOCK_PATH; online mode is meant for a single
+    uvicorn worker. Seeding a model without a checkpoint happens in the
+    trainer thread, so startup does not wait for it.
+
+    Returns False when the categorizer is not in online mode or another
+    process already runs the trainer.
+    """
+    global _trainer, _trainer_lock_file
+    if CATEGORIZER_MODE != "online":
+        return False
+    with _trainer_lock:
+        if _trainer is not None:
+            return True
+        lock_file = open(TRAINER_LOCK_PATH, "a+")
+        if not _lock_file(lock_file):
+            lock_file.close()
+            logger.warning(
+                "Another process holds %s, so this worker does not train the online "
+                "categorizer and ignores corrections; CATEGORIZER_MODE=online expects "
+                "a single worker (uvicorn --workers 1)", TRAINER_LOCK_PATH
+            )
+            return False
+        _trainer_lock_file = lock_file
+        model = get_categorizer()
+        _stop.clear()
+        _trainer = threading.Thread(target=_train, args=(model,), name="category-trainer", daemon=True)
+        _trainer.start()
+    return True
+
+def stop_trainer(timeout: float = 30.0):
+    """Apply queued corrections, write a final checkpoint and stop the trainer"""
+    global _trainer, _trainer_lock_file
+    with _trainer_lock:
+        if _trainer is None:
+            return
+        _stop.set()
+        _trainer.join(timeout)
+        _trainer = None
+        _trainer_lock_file.close()
+        _trainer_lock_file = None
+
+def get_trainer_stats() -> dict:
+    samples_seen = get_categorizer().samples_seen if CATEGORIZER_MODE == "online" else None
+    return {
+        **_stats,
+        "running": _trainer is not None,
+        "pending": _corrections.qsize(),
+        "samples_seen": samples_seen
+    }
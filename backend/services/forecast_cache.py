@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from app.data_version import get_data_version
+from ml.forecaster import forecast_balance, simulate_balance
+
+load_dotenv()
+
+# Forecasts kept in memory, and how long one may be served
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "1000"))
+FORECAST_CACHE_TTL_SECONDS = float(os.getenv("FORECAST_CACHE_TTL_SECONDS", "3600"))
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                    self.evictions += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, predicate):
+        """Remove entries whose key matches predicate"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+# (user_id, data_version, days_ahead, simulate, today) -> forecast dict
+_forecasts = TTLCache(FORECAST_CACHE_SIZE, FORECAST_CACHE_TTL_SECONDS)
+
+def get_forecast(user_id: int, db: Session, days_ahead: int = 30, simulate: bool = False) -> dict:
+    """
+    forecast_balance (or simulate_balance when `simulate` is set), served
+    from the cache while the user's data version and the current day are
+    unchanged
+
+    Only a primary-key lookup of the data version runs on a hit. The
+    returned dict is shared with the cache and must not be modified.
+    """
+    version = get_data_version(user_id, db)
+    key = (user_id, version, days_ahead, simulate, date.today())
+    forecast = _forecasts.get(key)
+    if forecast is None:
+        if simulate:
+            forecast = simulate_balance(user_id, db, days_ahead)
+        else:
+            forecast = forecast_balance(user_id, db, days_ahead)
+        # Entries for older versions of this user can never be hit again
+        _forecasts.discard(lambda k: k[0] == user_id and k[1] != version)
+        _forecasts.put(key, forecast)
+    return forecast
+
+def get_forecast_cache_stats() -> dict:
+    return _forecasts.stats()
@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+from dotenv import load_dotenv
+
+from app.database import SessionLocal
+from services.transaction_processor import ingest_csv, check_upload_size, READ_CHUNK_BYTES
+from ml.periodicity_detector import detect_subscriptions
+
+load_dotenv()
+
+# Uploads processed concurrently (one at a time per user); further jobs wait in the queue
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+
+# Finished jobs stay queryable for this long
+JOB_RETENTION = timedelta(hours=1)
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# Jobs waiting behind a running job of the same user, keyed by user id. A
+# user is present while one of their jobs runs, so ingest and detection for
+# one user never overlap (concurrent detections would seed the same merchant
+# groups twice) and waiting jobs do not hold a worker thread.
+_user_queues = {}
+
+def _update_job(job_id: str, **fields):
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+
+def _purge_finished_jobs():
+    cutoff = datetime.utcnow() - JOB_RETENTION
+    with _jobs_lock:
+        expired = [
+            job_id for job_id, job in _jobs.items()
+            if job["finished_at"] and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del _jobs[job_id]
+
+def _run_job(job_id: str, path: str, size: int, user_id: int):
+    """Parse, save and detect in a worker thread with its own DB session"""
+    db = SessionLocal()
+    try:
+        _update_job(job_id, status="running", stage="parsing")
+
+        def on_progress(rows_processed, bytes_read):
+            _update_job(
+                job_id,
+                rows_processed=rows_processed,
+                progress=round(min(bytes_read / size, 1.0) * 0.9, 3) if size else 0.0
+            )
+
+        with open(path, "rb") as f:
+            result = ingest_csv(f, user_id, db, size=size, on_progress=on_progress)
+
+        _update_job(job_id, stage="detecting", progress=0.9)
+        detect_subscriptions(user_id, db)
+
+        _update_job(
+            job_id,
+            status="completed",
+            stage="done",
+            progress=1.0,
+            transactions_count=result["inserted"],
+            duplicates_skipped=result["skipped"],
+            invalid_rows=result["invalid"],
+            errors=result["errors"],
+            finished_at=datetime.utcnow()
+        )
+    except Exception as e:
+        db.rollback()
+        _update_job(
+            job_id,
+            status="failed",
+            error=f"Error processing file: {str(e)}",
+            finished_at=datetime.utcnow()
+        )
+    finally:
+        db.close()
+        os.remove(path)
+
+def _next_user_job(user_id: int) -> Optional[tuple]:
+    """Pop the user's next queued job, or mark the user idle if there is none"""
+    with _jobs_lock:
+        pending = _user_queues[user_id]
+        job_args = pending.popleft() if pending else None
+        if job_args is None:
+            del _user_queues[user_id]
+        return job_args
+
+def _run_user_jobs(user_id: int, job_args: tuple):
+    """Run a user's job, then the jobs queued behind it, in submission order"""
+    while job_args is not None:
+        try:
+            _run_job(*job_args)
+        finally:
+            job_args = _next_user_job(user_id)
+
+def try_reserve_user(user_id: int) -> bool:
+    """
+    Hold a user as if one of their jobs were running, so uploads submitted
+    meanwhile wait in their queue. Returns False if a job is queued or
+    running for the user already.
+    """
+    with _jobs_lock:
+        if user_id in _user_queues:
+            return False
+        _user_queues[user_id] = deque()
+        return True
+
+def release_user(user_id: int):
+    """End a try_reserve_user hold and start the uploads that queued behind it"""
+    job_args = _next_user_job(user_id)
+    if job_args is not None:
+        _executor.submit(_run_user_jobs, user_id, job_args)
+
+def submit_upload(upload_file, filename: str, user_id: int) -> dict:
+    """
+    Copy an upload to a private temp file and queue it for ingestion
+
+    The request's spooled file is closed when the response is sent, so it is
+    copied READ_CHUNK_BYTES at a time before the job is handed to the pool.
+    """
+    _purge_finished_jobs()
+
+    fd, path = tempfile.mkstemp(suffix=".csv", prefix="upload-")
+    with os.fdopen(fd, "wb") as dst:
+        upload_file.seek(0)
+        shutil.copyfileobj(upload_file, dst, READ_CHUNK_BYTES)
+        size = dst.tell()
+
+    try:
+        check_upload_size(size)
+    except Exception:
+        os.remove(path)
+        raise
+
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "user_id": user_id,
+        "filename": filename,
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0.0,
+        "rows_processed": 0,
+        "transactions_count": None,
+        "duplicates_skipped": None,
+        "invalid_rows": None,
+        "errors": [],
+        "error": None,
+        "created_at": datetime.utcnow(),
+        "finished_at": None
+    }
+    job_args = (job_id, path, size, user_id)
+    with _jobs_lock:
+        _jobs[job_id] = job
+        snapshot = dict(job)
+        if user_id in _user_queues:
+            _user_queues[user_id].append(job_args)
+            return snapshot
+        _user_queues[user_id] = deque()
+
+    _executor.submit(_run_user_jobs, user_id, job_args)
+    return snapshot
+
+def get_job(job_id: str, user_id: int) -> Optional[dict]:
+    """Return a snapshot of a job owned by the user, or None"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None or job["user_id"] != user_id:
+            return None
+        return dict(job)
@@ -0,0 +1,145 @@
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from app.database import insert_or_ignore, insert_or_replace
+from app.models import Merchant, MerchantAlias
+from ml.categorizer import rule_based_category
+from ml.keyword_matcher import get_keyword_rules
+from ml.periodicity_detector import extract_subscription_name, normalize_description
+
+load_dotenv()
+
+# Normalized descriptions kept in the in-process cache
+MERCHANT_CACHE_SIZE = int(os.getenv("MERCHANT_CACHE_SIZE", "50000"))
+
+class LRUCache:
+    """Small thread-safe LRU mapping with a bounded number of entries"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+# normalized description -> (merchant_id, category); committed aliases only
+_alias_cache = LRUCache(MERCHANT_CACHE_SIZE)
+
+# Session.info key of aliases written in the session's open transaction
+_PENDING_ALIASES = "pending_merchant_aliases"
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed_aliases(session):
+    for text, value in session.info.pop(_PENDING_ALIASES, {}).items():
+        _alias_cache.put(text, value)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_aliases(session):
+    # Their merchant ids were rolled back and may be reused by other merchants
+    session.info.pop(_PENDING_ALIASES, None)
+
+def _load_aliases(normalized, db: Session) -> dict:
+    """Aliases resolved with the current keyword rules; older ones count as unseen"""
+    rows = db.query(
+        MerchantAlias.normalized_description, MerchantAlias.merchant_id, MerchantAlias.category
+    ).filter(
+        MerchantAlias.normalized_description.in_(normalized),
+        MerchantAlias.rules_version == get_keyword_rules().version
+    ).all()
+    return {row.normalized_description: (row.merchant_id, row.category) for row in rows}
+
+def _write_aliases(descriptions: dict, db: Session):
+    """
+    Insert merchants and aliases for unseen descriptions, replacing aliases
+    resolved with other keyword rules
+
+    Args:
+        descriptions: {normalized description: one raw description}
+    """
+    names = {text: extract_subscription_name(raw) for text, raw in descriptions.items()}
+
+    db.connection().execute(
+        insert_or_ignore(db, Merchant, ["name"]),
+        [{"name": name} for name in set(names.values())]
+    )
+    merchant_ids = dict(
+        db.query(Merchant.name, Merchant.id).filter(Merchant.name.in_(set(names.values()))).all()
+    )
+
+    rules_version = get_keyword_rules().version
+    db.connection().execute(
+        insert_or_replace(db, MerchantAlias, ["normalized_description"],
+                          ["merchant_id", "category", "rules_version"]),
+        [
+            {
+                "normalized_description": text,
+                "merchant_id": merchant_ids[names[text]],
+                "category": rule_based_category(raw),
+                "rules_version": rules_version
+            }
+            for text, raw in descriptions.items()
+        ]
+    )
+
+def resolve_merchants(descriptions, db: Session) -> dict:
+    """
+    Resolve raw descriptions to (merchant_id, category)
+
+    Each distinct normalized description is looked up in the LRU cache, then
+    in merchant_aliases; unseen ones, and aliases resolved with an older
+    version of the keyword rules, get a merchant named by
+    extract_subscription_name and a rule-based category, computed once.
+    New rows are written on the session's connection and committed with it;
+    they enter the cache only once that commit succeeds.
+
+    Returns: {raw description: (merchant_id, category)}
+    """
+    normalized = {raw: normalize_description(raw) for raw in descriptions}
+
+    resolved = {}
+    misses = {}
+    for raw, text in normalized.items():
+        hit = _alias_cache.get(text)
+        if hit is None:
+            misses.setdefault(text, raw)
+        else:
+            resolved[text] = hit
+
+    if misses:
+        pending = db.info.setdefault(_PENDING_ALIASES, {})
+        found = _load_aliases(list(misses), db)
+        for text, value in found.items():
+            if text not in pending:
+                _alias_cache.put(text, value)
+        unseen = {text: raw for text, raw in misses.items() if text not in found}
+        if unseen:
+            _write_aliases(unseen, db)
+            created = _load_aliases(list(unseen), db)
+            pending.update(created)
+            found.update(created)
+        resolved.update(found)
+
+    return {raw: resolved[text] for raw, text in normalized.items()}
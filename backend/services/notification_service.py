@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
+from app.data_version import bump_notifications_version
 from app.models import Subscription, Notification
-from ml.forecaster import forecast_balance
+from services.forecast_cache import get_forecast
 from ml.periodicity_detector import calculate_monthly_subscription_cost
 
 def generate_plain_language_alert(user_id: int, db: Session):
@@ -46,7 +47,7 @@ def generate_plain_language_alert(user_id: int, db: Session):
         message = f"Your {first_names} will cost ₹{total_cost:,.0f} this month"
     
     # Get forecast to check for low balance
-    forecast = forecast_balance(user_id, db)
+    forecast = get_forecast(user_id, db)
     
     if forecast['low_balance_dates']:
         first_low_date = forecast['low_balance_dates'][0]
@@ -73,6 +74,7 @@ def create_notification(user_id: int, message: str, notification_type: str, db:
         type=notification_type
     )
     db.add(notification)
+    bump_notifications_version(user_id, db)
     db.commit()
     return notification
 
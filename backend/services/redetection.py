@@ -0,0 +1,242 @@
+"""
+Re-run subscription detection for every user, e.g. after changing thresholds.
+
+Users are sharded into batches across a process pool; each worker opens its
+own session. Completed user ids are written to a JSON checkpoint so an
+interrupted run can resume where it stopped:
+
+    cd backend
+    python -m services.redetection --workers 4 --batch-size 50 --resume
+
+Run from the API (POST /api/admin/redetect), a user with an upload queued
+or running is deferred until it finishes, and uploads submitted while the
+user's batch runs wait for it. The command line cannot see the API's
+upload jobs, so run it while uploads are stopped.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from dotenv import load_dotenv
+
+# Allow running as a script from the backend directory
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from app.database import SessionLocal, engine
+from app.models import User
+from ml.periodicity_detector import detect_subscriptions
+from services.ingestion_jobs import try_reserve_user, release_user
+
+load_dotenv()
+
+REDETECT_WORKERS = int(os.getenv("REDETECT_WORKERS", str(os.cpu_count() or 2)))
+REDETECT_BATCH_SIZE = int(os.getenv("REDETECT_BATCH_SIZE", "50"))
+REDETECT_CHECKPOINT = os.getenv("REDETECT_CHECKPOINT", "redetect_checkpoint.json")
+
+# How long to wait before retrying users whose uploads are still in progress
+BUSY_RETRY_SECONDS = 1.0
+
+_state_lock = threading.Lock()
+_run_state = {
+    "status": "idle",  # "idle", "running", "completed", "failed"
+    "total_users": 0,
+    "completed_users": 0,
+    "failed_users": 0,
+    "started_at": None,
+    "finished_at": None,
+    "error": None
+}
+
+def _init_worker():
+    """Drop connections inherited from the parent process, if any"""
+    engine.dispose(close=False)
+
+def redetect_batch(user_ids):
+    """
+    Worker entry point: fully re-detect subscriptions for a batch of users
+
+    Returns: (completed user ids, {user id: error message})
+    """
+    db = SessionLocal()
+    completed, failed = [], {}
+    try:
+        for user_id in user_ids:
+            try:
+                detect_subscriptions(user_id, db, full=True)
+                completed.append(user_id)
+            except Exception as e:
+                db.rollback()
+                failed[user_id] = str(e)
+    finally:
+        db.close()
+    return completed, failed
+
+def _load_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(json.load(f).get("completed", []))
+
+def _save_checkpoint(path: str, completed: set):
+    """Write atomically so an interrupted run never leaves a torn file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"completed": sorted(completed), "updated_at": datetime.utcnow().isoformat()}, f)
+    os.replace(tmp_path, path)
+
+def run_redetection(
+    workers: int = REDETECT_WORKERS,
+    batch_size: int = REDETECT_BATCH_SIZE,
+    checkpoint_path: str = REDETECT_CHECKPOINT,
+    resume: bool = True,
+    on_progress=None
+) -> dict:
+    """
+    Re-detect subscriptions for all users across a process pool
+
+    Args:
+        resume: skip users recorded in the checkpoint by an earlier run
+        on_progress: optional callback(completed, failed, total) called as
+            each batch finishes
+
+    Returns:
+        dict with total, completed and failed user counts and per-user errors
+    """
+    completed = _load_checkpoint(checkpoint_path) if resume else set()
+
+    db = SessionLocal()
+    try:
+        user_ids = [row.id for row in db.query(User.id).order_by(User.id).all()]
+    finally:
+        db.close()
+
+    pending = [user_id for user_id in user_ids if user_id not in completed]
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    total = len(user_ids)
+    errors = {}
+
+    if on_progress:
+        on_progress(len(completed), 0, total)
+
+    # Workers are spawned, not forked: the API process runs other threads
+    # whose locks a forked child would inherit in whatever state they were in
+    queue = deque(batches)
+    in_flight = {}
+    held = set()
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, mp_context=context) as pool:
+            while queue or in_flight:
+                # Batches are submitted only as workers free up, so a user is
+                # held back from uploads only while their batch runs
+                for _ in range(len(queue)):
+                    if len(in_flight) >= workers:
+                        break
+                    batch = queue.popleft()
+                    reserved = [user_id for user_id in batch if try_reserve_user(user_id)]
+                    held.update(reserved)
+                    if len(reserved) < len(batch):
+                        reserved_ids = set(reserved)
+                        queue.append([user_id for user_id in batch if user_id not in reserved_ids])
+                    if reserved:
+                        in_flight[pool.submit(redetect_batch, reserved)] = reserved
+
+                if not in_flight:
+                    # Only users with uploads in progress are left
+                    time.sleep(BUSY_RETRY_SECONDS)
+                    continue
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    for user_id in in_flight.pop(future):
+                        held.discard(user_id)
+                        release_user(user_id)
+                    done, failed = future.result()
+                    completed.update(done)
+                    errors.update(failed)
+                    _save_checkpoint(checkpoint_path, completed)
+                    if on_progress:
+                        on_progress(len(completed), len(errors), total)
+    finally:
+        for user_id in held:
+            release_user(user_id)
+
+    # A finished run starts from scratch next time
+    if not errors and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    return {
+        "total_users": total,
+        "completed_users": len(completed),
+        "failed_users": len(errors),
+        "errors": errors
+    }
+
+def get_redetection_status() -> dict:
+    with _state_lock:
+        return dict(_run_state)
+
+def _update_state(**fields):
+    with _state_lock:
+        _run_state.update(fields)
+
+def start_redetection(workers: int, batch_size: int, resume: bool) -> Optional[dict]:
+    """
+    Start a re-detection run in a background thread
+
+    Returns: the run state, or None if a run is already in progress
+    """
+    with _state_lock:
+        if _run_state["status"] == "running":
+            return None
+        _run_state.update(
+            status="running",
+            total_users=0,
+            completed_users=0,
+            failed_users=0,
+            started_at=datetime.utcnow(),
+            finished_at=None,
+            error=None
+        )
+
+    def on_progress(done, failed, total):
+        _update_state(completed_users=done, failed_users=failed, total_users=total)
+
+    def run():
+        try:
+            run_redetection(workers, batch_size, resume=resume, on_progress=on_progress)
+            _update_state(status="completed", finished_at=datetime.utcnow())
+        except Exception as e:
+            _update_state(status="failed", error=str(e), finished_at=datetime.utcnow())
+
+    threading.Thread(target=run, name="redetection", daemon=True).start()
+    return get_redetection_status()
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run subscription detection for all users")
+    parser.add_argument("--workers", type=int, default=REDETECT_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=REDETECT_BATCH_SIZE)
+    parser.add_argument("--checkpoint", default=REDETECT_CHECKPOINT)
+    parser.add_argument("--resume", action="store_true", help="Skip users completed by an earlier run")
+    args = parser.parse_args()
+
+    def on_progress(done, failed, total):
+        print(f"{done}/{total} users re-detected, {failed} failed", flush=True)
+
+    result = run_redetection(args.workers, args.batch_size, args.checkpoint, args.resume, on_progress)
+    for user_id, error in result["errors"].items():
+        print(f"User {user_id}: {error}")
+    print(f"✅ Re-detection finished: {result['completed_users']}/{result['total_users']} users")
+
+if __name__ == "__main__":
+    main()
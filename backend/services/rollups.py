@@ -0,0 +1,109 @@
+import numpy as np
+from datetime import datetime
+from sqlalchemy import select, func, case, cast, Float
+from sqlalchemy.orm import Session
+
+from app.database import insert_or_increment
+from app.models import Transaction, Subscription, MonthlyRollup
+from ml.period_engine import PERIODS
+
+def month_keys(dates) -> np.ndarray:
+    """"YYYY-MM" of each date"""
+    return np.datetime_as_string(np.asarray(dates, dtype='datetime64[M]'))
+
+def apply_rollup_deltas(user_id: int, dates, amounts, db: Session, sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) transactions from the user's monthly
+    rollups with one upsert per touched month, in the caller's transaction
+    """
+    if len(dates) == 0:
+        return
+    months, index = np.unique(month_keys(dates), return_inverse=True)
+    amounts = np.asarray(amounts, dtype=float)
+    debits = np.bincount(index, weights=np.minimum(amounts, 0.0), minlength=len(months))
+    credits = np.bincount(index, weights=np.maximum(amounts, 0.0), minlength=len(months))
+    counts = np.bincount(index, minlength=len(months))
+
+    stmt = insert_or_increment(
+        db, MonthlyRollup, ["user_id", "month"], ["debit_sum", "credit_sum", "transaction_count"]
+    )
+    db.connection().execute(stmt, [
+        {
+            "user_id": user_id,
+            "month": month,
+            "debit_sum": sign * float(debit),
+            "credit_sum": sign * float(credit),
+            "transaction_count": sign * int(count)
+        }
+        for month, debit, credit, count in zip(months.tolist(), debits, credits, counts)
+    ])
+
+def rebuild_rollups(user_id: int, db: Session):
+    """Recompute a user's rollups from their transactions (for backfills)"""
+    db.query(MonthlyRollup).filter(MonthlyRollup.user_id == user_id).delete(synchronize_session=False)
+    rows = db.query(Transaction.date, Transaction.amount).filter(Transaction.user_id == user_id).all()
+    if rows:
+        dates, amounts = zip(*rows)
+        apply_rollup_deltas(user_id, dates, amounts, db)
+
+def _charges_per_month(frequency):
+    """SQL twin of period_engine.charges_per_month"""
+    custom_days = cast(func.substr(frequency, 7, func.length(frequency) - 11), Float)
+    return case(
+        *[(frequency == name, per_month) for name, _, _, _, per_month in PERIODS],
+        (frequency.like("every\\_%\\_days", escape="\\"), 30.44 / func.nullif(custom_days, 0)),
+        else_=0.0
+    )
+
+def dashboard_stats_statement(user_id: int):
+    """
+    One-row SELECT of the figures behind a user's TransactionStats, over the
+    monthly rollups and subscriptions, so the cost does not grow with
+    transaction history
+    """
+    current_month = datetime.now().strftime("%Y-%m")
+    rollups = select(MonthlyRollup).where(
+        MonthlyRollup.user_id == user_id, MonthlyRollup.transaction_count > 0
+    ).subquery()
+    active = select(Subscription).where(
+        Subscription.user_id == user_id, Subscription.status == "active"
+    ).subquery()
+
+    return select(
+        select(func.coalesce(func.sum(rollups.c.transaction_count), 0)).scalar_subquery(),
+        select(func.coalesce(func.sum(rollups.c.debit_sum), 0.0)).scalar_subquery(),
+        select(func.coalesce(func.sum(rollups.c.debit_sum), 0.0)).where(
+            rollups.c.month >= current_month
+        ).scalar_subquery(),
+        select(func.min(rollups.c.month)).scalar_subquery(),
+        select(func.count()).select_from(active).scalar_subquery(),
+        select(func.coalesce(
+            func.sum(active.c.amount * _charges_per_month(active.c.frequency)), 0.0
+        )).scalar_subquery()
+    )
+
+def stats_from_row(row) -> dict:
+    """TransactionStats from the row of dashboard_stats_statement"""
+    total_transactions, total_spent_overall, total_spent_this_month, first_month, total_subscriptions, monthly_cost = row
+
+    # Average over months from the first transaction's month to now
+    if first_month:
+        now = datetime.now()
+        first_year, first_month_number = (int(part) for part in first_month.split("-"))
+        num_months = (now.year - first_year) * 12 + (now.month - first_month_number) + 1
+        avg_spent_per_month = total_spent_overall / num_months
+    else:
+        avg_spent_per_month = 0.0
+
+    return {
+        "total_transactions": total_transactions,
+        "total_subscriptions": total_subscriptions,
+        "monthly_subscription_cost": abs(monthly_cost),
+        "total_spent_this_month": abs(total_spent_this_month),
+        "avg_spent_per_month": abs(avg_spent_per_month),
+        "total_spent_overall": abs(total_spent_overall)
+    }
+
+def dashboard_stats(user_id: int, db: Session) -> dict:
+    """TransactionStats for a user in one query"""
+    return stats_from_row(db.execute(dashboard_stats_statement(user_id)).one())
@@ -0,0 +1,148 @@
+import csv
+import io
+import os
+import orjson
+from sqlalchemy import select
+from dotenv import load_dotenv
+
+from app.database import SessionLocal
+from app.models import Transaction
+
+load_dotenv()
+
+# Rows fetched from the cursor and written per chunk of the response
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "2000"))
+
+# Columns of every export; Date, Description and Amount are what ingest reads back
+EXPORT_COLUMNS = ["Date", "Description", "Amount", "Category", "Is Recurring"]
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+class ExportFormatUnavailable(RuntimeError):
+    """Raised when an export format needs an optional dependency that is missing"""
+    pass
+
+def _batches(user_id: int):
+    """
+    Lists of up to EXPORT_BATCH_ROWS (date, description, amount, category,
+    is_recurring) tuples, oldest first, read through a server-side cursor
+
+    The generator owns its session, so it outlives the request's session
+    while the response streams.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            select(
+                Transaction.date, Transaction.description, Transaction.amount,
+                Transaction.category, Transaction.is_recurring
+            ).where(
+                Transaction.user_id == user_id
+            ).order_by(Transaction.date, Transaction.id).execution_options(yield_per=EXPORT_BATCH_ROWS)
+        )
+        for partition in result.partitions():
+            yield partition
+    finally:
+        db.close()
+
+def iter_csv(user_id: int):
+    """
+    CSV export in the upload format, one chunk per batch
+
+    Dates are ISO 8601 and amounts are written with repr, so uploading the
+    file again reproduces every transaction's fingerprint and is skipped as
+    duplicates.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in _batches(user_id):
+        writer.writerows(
+            (date.isoformat(), description, repr(float(amount)), category or "", bool(is_recurring))
+            for date, description, amount, category, is_recurring in batch
+        )
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def iter_ndjson(user_id: int):
+    """One JSON object per line, keyed by snake_case column name"""
+    keys = [column.lower().replace(" ", "_") for column in EXPORT_COLUMNS]
+    for batch in _batches(user_id):
+        yield b"".join(
+            orjson.dumps(dict(zip(keys, row)), option=orjson.OPT_APPEND_NEWLINE)
+            for row in batch
+        )
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_parquet(user_id: int):
+    """
+    Parquet export with one row group per batch, streamed as each row
+    group is written; the footer follows the last one
+
+    Requires pyarrow, which is an optional dependency.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportFormatUnavailable("Parquet export requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([
+        ("date", pa.timestamp("us")),
+        ("description", pa.string()),
+        ("amount", pa.float64()),
+        ("category", pa.string()),
+        ("is_recurring", pa.bool_())
+    ])
+
+    def generate():
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema)
+        try:
+            for batch in _batches(user_id):
+                columns = list(zip(*batch))
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                    schema=schema
+                ))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    return generate()
+
+EXPORTERS = {
+    "csv": iter_csv,
+    "ndjson": iter_ndjson,
+    "parquet": iter_parquet
+}
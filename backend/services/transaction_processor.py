@@ -1,76 +1,317 @@
 import pandas as pd
+import numpy as np
+import hashlib
 import io
+import os
 from datetime import datetime
+from typing import Optional
+from pandas.tseries.api import guess_datetime_format
 from sqlalchemy.orm import Session
 from fastapi import UploadFile
+from dotenv import load_dotenv
 
+from app.database import insert_or_ignore
+from app.data_version import bump_data_version
 from app.models import Transaction
+from services.merchant_resolver import resolve_merchants
+from services.rollups import apply_rollup_deltas
+from ml.categorizer import get_categorizer
 
-async def process_csv_file(file: UploadFile, user_id: int, db: Session):
+load_dotenv()
+
+# Uploads larger than this are rejected while streaming, before they are fully read
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "50"))
+MAX_UPLOAD_SIZE_BYTES = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+
+# Rows parsed, normalized and committed per chunk
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "5000"))
+
+# Per-row errors returned in the upload response; the total is always counted
+MAX_REPORTED_ERRORS = 100
+
+# Bytes read from the spooled upload per read call
+READ_CHUNK_BYTES = 64 * 1024
+
+class UploadTooLargeError(ValueError):
+    """Raised when an uploaded file exceeds MAX_UPLOAD_SIZE_BYTES"""
+    pass
+
+class _SizeLimitedReader(io.RawIOBase):
     """
-    Process uploaded CSV file and save transactions to database
-    
+    Read-only stream over the spooled upload that fails once more than
+    `limit` bytes have been read, so oversized files never get parsed in full
+    """
+
+    def __init__(self, raw, limit: int):
+        self._raw = raw
+        self._limit = limit
+        self._bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        self._bytes_read += len(data)
+        if self._bytes_read > self._limit:
+            raise UploadTooLargeError(
+                f"File exceeds maximum upload size of {MAX_UPLOAD_SIZE_MB} MB"
+            )
+        buffer[:len(data)] = data
+        return len(data)
+
+def check_upload_size(size):
+    """Raise UploadTooLargeError if a known upload size is over the limit"""
+    if size is not None and size > MAX_UPLOAD_SIZE_BYTES:
+        raise UploadTooLargeError(
+            f"File exceeds maximum upload size of {MAX_UPLOAD_SIZE_MB} MB"
+        )
+
+def iter_csv_chunks(raw_file, size=None, chunk_rows: int = CSV_CHUNK_ROWS):
+    """
+    Yield DataFrames of at most `chunk_rows` rows read from a binary file object.
+
+    The file is consumed READ_CHUNK_BYTES at a time, so memory use
+    depends on the chunk size rather than on the size of the statement.
+    """
+    check_upload_size(size)
+
+    raw_file.seek(0)
+    raw = _SizeLimitedReader(raw_file, MAX_UPLOAD_SIZE_BYTES)
+    text = io.TextIOWrapper(io.BufferedReader(raw, buffer_size=READ_CHUNK_BYTES), encoding='utf-8')
+
+    try:
+        yield from pd.read_csv(text, chunksize=chunk_rows)
+    finally:
+        text.detach()
+
+def _coerce_amounts(series: pd.Series):
+    """
+    Vectorized numeric coercion of an amount column.
+
+    Blanks become NaN and thousands separators are stripped. Returns the
+    float values and a mask of cells that were non-blank but not numeric.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float), pd.Series(False, index=series.index)
+
+    text = series.astype('string').str.strip().str.replace(',', '', regex=False)
+    blank = text.isna() | (text == '')
+    values = pd.to_numeric(text.mask(blank), errors='coerce').astype(float)
+    malformed = values.isna() & ~blank
+    return values, malformed
+
+def _row_errors(df: pd.DataFrame, mask: pd.Series, column: str, message: str) -> list:
+    """Describe malformed cells; `row` is the line number in the uploaded file"""
+    return [
+        {"row": int(index) + 2, "column": column, "value": "" if pd.isna(value) else str(value), "error": message}
+        for index, value in df.loc[mask, column].items()
+    ]
+
+def infer_date_format(df: pd.DataFrame) -> Optional[str]:
+    """
+    Date format of a statement, guessed from its first date the way pandas
+    does for a whole column; None if there is no date or it cannot be guessed
+    """
+    for column in df.columns:
+        if str(column).strip().lower() == 'date':
+            dates = df[column].dropna()
+            if not dates.empty:
+                return guess_datetime_format(str(dates.iloc[0]))
+    return None
+
+def normalize_chunk(df: pd.DataFrame, date_format: Optional[str] = None):
+    """
+    Normalize one chunk of a bank statement into date, description and amt columns
+
     Expected CSV format:
     Date, Description, Amount
     or
     Date, Description, Debit, Credit
+
+    Args:
+        date_format: format of the whole file (see infer_date_format), so
+            every chunk reads ambiguous dates like 01/02/2024 the same way;
+            inferred from this chunk when None
+
+    Returns:
+        (normalized DataFrame, list of per-row errors for malformed cells).
+        Rows with malformed cells are dropped instead of failing the upload.
     """
-    contents = await file.read()
-    df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
-    
     # Normalize column names
     df.columns = df.columns.str.strip().str.lower()
-    
+
+    if 'date' not in df.columns:
+        raise ValueError("CSV must have 'Date' column")
+    if 'description' not in df.columns:
+        raise ValueError("CSV must have 'Description' column")
+
+    errors = []
+    invalid = pd.Series(False, index=df.index)
+
     # Handle different CSV formats
     if 'amount' in df.columns:
         # Simple format: Date, Description, Amount
-        df.rename(columns={'amount': 'amt'}, inplace=True)
+        amount, malformed = _coerce_amounts(df['amount'])
+        errors += _row_errors(df, malformed, 'amount', "Invalid amount")
+        invalid |= malformed
+        df['amt'] = amount.fillna(0.0)
     elif 'debit' in df.columns and 'credit' in df.columns:
         # Bank format: Date, Description, Debit, Credit
-        df['amt'] = df.apply(
-            lambda row: -float(row['debit']) if pd.notna(row['debit']) and str(row['debit']).strip() != '' 
-            else (float(row['credit']) if pd.notna(row['credit']) and str(row['credit']).strip() != '' else 0),
-            axis=1
-        )
+        # Debit wins when both are filled; rows with neither are 0
+        debit, bad_debit = _coerce_amounts(df['debit'])
+        credit, bad_credit = _coerce_amounts(df['credit'])
+        errors += _row_errors(df, bad_debit, 'debit', "Invalid debit amount")
+        errors += _row_errors(df, bad_credit, 'credit', "Invalid credit amount")
+        invalid |= bad_debit | bad_credit
+        df['amt'] = (-debit).where(debit.notna(), credit.fillna(0.0))
     else:
         raise ValueError("CSV must have 'Amount' column or 'Debit' and 'Credit' columns")
-    
-    # Parse date
-    if 'date' not in df.columns:
-        raise ValueError("CSV must have 'Date' column")
-    
-    df['date'] = pd.to_datetime(df['date'])
-    
+
+    # Parse date in the file's format. ISO 8601 dates that do not fit it
+    # exactly (e.g. with and without fractional seconds) are parsed again;
+    # anything else is invalid rather than read with another day/month order
+    parsed_dates = pd.to_datetime(df['date'], errors='coerce', format=date_format)
+    retry = parsed_dates.isna() & df['date'].notna()
+    if retry.any():
+        parsed_dates[retry] = pd.to_datetime(df.loc[retry, 'date'], errors='coerce', format='ISO8601')
+    bad_date = parsed_dates.isna()
+    errors += _row_errors(df, bad_date, 'date', "Invalid or missing date")
+    invalid |= bad_date
+    df['date'] = parsed_dates
+
     # Clean description
-    if 'description' not in df.columns:
-        raise ValueError("CSV must have 'Description' column")
-    
-    df['description'] = df['description'].str.strip()
-    
+    df['description'] = df['description'].astype('string').str.strip()
+    missing_description = df['description'].isna() | (df['description'] == '')
+    errors += _row_errors(df, missing_description, 'description', "Missing description")
+    invalid |= missing_description
+
+    errors.sort(key=lambda e: e["row"])
+    df = df.loc[~invalid]
+
     # Remove duplicates (same date, description, amount)
-    df = df.drop_duplicates(subset=['date', 'description', 'amt'])
-    
-    # Save to database
-    transactions = []
-    for _, row in df.iterrows():
-        # Check if transaction already exists
-        existing = db.query(Transaction).filter(
-            Transaction.user_id == user_id,
-            Transaction.date == row['date'],
-            Transaction.description == row['description'],
-            Transaction.amount == row['amt']
-        ).first()
-        
-        if not existing:
-            transaction = Transaction(
-                user_id=user_id,
-                date=row['date'],
-                description=row['description'],
-                amount=row['amt']
-            )
-            db.add(transaction)
-            transactions.append(transaction)
-    
+    return df.drop_duplicates(subset=['date', 'description', 'amt']), errors
+
+def transaction_fingerprint(date, description: str, amount: float) -> str:
+    """
+    Stable per-user identity of a transaction, used by the unique
+    (user_id, fingerprint) constraint to skip rows that were already uploaded
+
+    Amounts are rounded to cents, so a value the CSV parser reads back a
+    float step away from the stored one still matches.
+    """
+    key = f"{pd.Timestamp(date).isoformat()}|{description}|{float(np.round(float(amount), 2))!r}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _chunk_fingerprints(df: pd.DataFrame) -> list:
+    """transaction_fingerprint for every row, with the key strings built column-wise"""
+    dates = df['date']
+    if (dates.dt.microsecond != 0).any() or (dates.dt.nanosecond != 0).any():
+        date_keys = dates.map(lambda date: date.isoformat())
+    else:
+        seconds = dates.to_numpy().astype('datetime64[s]')
+        date_keys = pd.Series(np.datetime_as_string(seconds), index=dates.index)
+    keys = date_keys + '|' + df['description'].astype(str) + '|' + df['amt'].astype(float).round(2).astype(str)
+    return [hashlib.sha1(key.encode('utf-8')).hexdigest() for key in keys]
+
+def save_chunk(df: pd.DataFrame, user_id: int, db: Session) -> int:
+    """
+    Save one normalized chunk with a single insert-or-ignore statement and
+    commit it together with the monthly rollups of the rows that were new.
+    Returns the number of new rows
+    """
+    if df.empty:
+        return 0
+
+    # Each distinct description is resolved to a merchant once per chunk
+    descriptions = df['description'].unique().tolist()
+    merchants = resolve_merchants(descriptions, db)
+
+    # One vectorized predict per chunk with a trained model; otherwise the
+    # rule-based category stored with the merchant alias
+    categorizer = get_categorizer()
+    if categorizer.is_trained:
+        categories = dict(zip(descriptions, categorizer.predict_batch(descriptions)))
+    else:
+        categories = {description: merchants[description][1] for description in descriptions}
+
+    rows = [
+        {
+            "user_id": user_id,
+            "date": date,
+            "description": description,
+            "amount": amount,
+            "merchant_id": merchants[description][0],
+            "category": categories[description],
+            "fingerprint": fingerprint,
+        }
+        for date, description, amount, fingerprint in zip(
+            df['date'].dt.to_pydatetime(),
+            df['description'].tolist(),
+            df['amt'].astype(float).tolist(),
+            _chunk_fingerprints(df)
+        )
+    ]
+
+    # Core executemany on the session's connection; RETURNING yields only
+    # the rows that were not ignored as duplicates
+    stmt = insert_or_ignore(db, Transaction, ["user_id", "fingerprint"]).returning(
+        Transaction.date, Transaction.amount
+    )
+    inserted = db.connection().execute(stmt, rows).all()
+    if inserted:
+        dates, amounts = zip(*inserted)
+        apply_rollup_deltas(user_id, dates, amounts, db)
+        bump_data_version(user_id, db)
     db.commit()
-    
-    return transactions
+
+    return len(inserted)
+
+def ingest_csv(raw_file, user_id: int, db: Session, size=None, on_progress=None) -> dict:
+    """
+    Parse a CSV statement from a binary file object and save its transactions
+
+    The file is streamed in chunks of CSV_CHUNK_ROWS rows; each chunk is
+    normalized and written with one insert-or-ignore statement, so duplicates
+    within the file and against earlier uploads are skipped by the database.
+    The date format is inferred once, from the first date in the file.
+
+    Args:
+        on_progress: optional callback(rows_processed, bytes_read) called
+            after each chunk is committed
+
+    Returns:
+        dict with the number of rows inserted, skipped as duplicates and
+        rejected as invalid, plus the first MAX_REPORTED_ERRORS row errors
+    """
+    inserted = 0
+    total_rows = 0
+    invalid_rows = 0
+    errors = []
+    date_format = None
+    for chunk in iter_csv_chunks(raw_file, size):
+        total_rows += len(chunk)
+        if date_format is None:
+            date_format = infer_date_format(chunk)
+        normalized, chunk_errors = normalize_chunk(chunk, date_format)
+        invalid_rows += len({e["row"] for e in chunk_errors})
+        errors.extend(chunk_errors[:MAX_REPORTED_ERRORS - len(errors)])
+        inserted += save_chunk(normalized, user_id, db)
+        if on_progress:
+            on_progress(total_rows, raw_file.tell())
+
+    return {
+        "inserted": inserted,
+        "skipped": total_rows - inserted - invalid_rows,
+        "invalid": invalid_rows,
+        "errors": errors
+    }
+
+async def process_csv_file(file: UploadFile, user_id: int, db: Session) -> dict:
+    """
+    Process uploaded CSV file and save transactions to database
+
+    Runs ingest_csv inline on the spooled upload; the upload endpoint uses
+    services.ingestion_jobs to do the same work off the event loop.
+    """
+    return ingest_csv(file.file, user_id, db, size=file.size)
@@ -0,0 +1,124 @@
+import re
+from sqlalchemy import select, literal, literal_column, func, text, or_, Float
+from sqlalchemy.sql import table, column
+
+from app.models import Transaction
+
+SEARCH_TABLE = "transactions_fts"
+
+# Prefix lengths with their own FTS index. A longer prefix would make FTS5
+# merge the postings of every matching term across all users, so longer
+# words are looked up by their first 4 characters and checked with GLOB.
+SEARCH_PREFIX_LENGTHS = (2, 3, 4)
+
+# Index rowids are (user_id << 32) + transaction id: one user's entries form
+# a contiguous rowid range that FTS5 seeks into, instead of reading every
+# user's postings of a term
+USER_ROWID_SHIFT = 32
+
+# External-content FTS5 index over transaction descriptions. Content rows
+# come from a view exposing the per-user rowid, which also lets the FTS
+# 'rebuild' command index existing transactions; triggers keep the index in
+# sync as transactions are inserted, deleted or edited.
+_SEARCH_DDL = [
+    f"""CREATE VIEW IF NOT EXISTS {SEARCH_TABLE}_content AS
+        SELECT (user_id << {USER_ROWID_SHIFT}) + id AS search_rowid, description FROM transactions""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        description,
+        content='{SEARCH_TABLE}_content', content_rowid='search_rowid',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='{" ".join(str(length) for length in SEARCH_PREFIX_LENGTHS)}'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON transactions BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, description)
+        VALUES ((new.user_id << {USER_ROWID_SHIFT}) + new.id, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON transactions BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description)
+        VALUES ('delete', (old.user_id << {USER_ROWID_SHIFT}) + old.id, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF description, user_id ON transactions BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description)
+        VALUES ('delete', (old.user_id << {USER_ROWID_SHIFT}) + old.id, old.description);
+        INSERT INTO {SEARCH_TABLE}(rowid, description)
+        VALUES ((new.user_id << {USER_ROWID_SHIFT}) + new.id, new.description);
+    END"""
+]
+
+_search_index = table(SEARCH_TABLE, column("rowid"))
+
+class SearchUnavailable(RuntimeError):
+    """Raised when the database does not support the full-text search index"""
+    pass
+
+def require_fts(db):
+    """Raise SearchUnavailable unless the session's database is SQLite (sync or async session)"""
+    if db.get_bind().dialect.name != "sqlite":
+        raise SearchUnavailable("Full-text search requires SQLite with FTS5")
+
+def create_search_index(conn):
+    """Create the FTS5 index and its sync triggers, and index existing rows"""
+    for ddl in _SEARCH_DDL:
+        conn.execute(text(ddl))
+    conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES('rebuild')"))
+
+def query_terms(query: str):
+    """
+    Split a free-text query into an FTS5 MATCH expression and the words
+    that must also be checked against the description
+
+    Every word must start a word of the description. Words are quoted, so
+    FTS5 syntax in the query is treated as text.
+
+    Returns: (match expression, list of words to check)
+    """
+    shortest, longest = min(SEARCH_PREFIX_LENGTHS), max(SEARCH_PREFIX_LENGTHS)
+    words = re.findall(r"[^\W_]+", query.lower())
+    prefixes = [f'"{word[:longest]}"*' for word in words if len(word) >= shortest]
+    if not prefixes:
+        raise ValueError(f"Search query needs a word of at least {shortest} characters")
+    # The index only narrows longer words down to their first characters,
+    # and single characters are too common to look up at all
+    checked_words = [word for word in words if not shortest <= len(word) <= longest]
+    return " ".join(prefixes), checked_words
+
+def starts_a_word(word: str):
+    """
+    Condition that `word` (letters and digits only) starts a word of the
+    description, i.e. begins it or follows a character that is not an
+    ASCII letter or digit; compared case-insensitively, like the index
+    """
+    description = func.lower(Transaction.description)
+    return or_(
+        description.op("GLOB")(f"{word}*"),
+        description.op("GLOB")(f"*[^a-z0-9]{word}*")
+    )
+
+def search_statement(user_id: int, query: str, columns, filters=(), limit: int = 50, offset: int = 0):
+    """
+    SELECT of a user's transactions whose description matches every word of
+    `query`, with a "score" column appended to `columns`
+
+    Ranked by the share of the description the query covers, so an exact
+    merchant name beats a long description that merely mentions it; newest
+    first among equal scores. BM25 is not used because its IDF step reads a
+    term's postings for all users on every query.
+    """
+    match, checked_words = query_terms(query)
+    query_length = sum(len(word) for word in re.findall(r"[^\W_]+", query))
+    score = literal(float(query_length), Float) / func.max(func.length(Transaction.description), 1)
+    first_rowid = user_id << USER_ROWID_SHIFT
+    last_rowid = first_rowid + (1 << USER_ROWID_SHIFT) - 1
+
+    return select(*columns, score.label("score")).join_from(
+        _search_index, Transaction,
+        Transaction.id == _search_index.c.rowid.op("&")((1 << USER_ROWID_SHIFT) - 1)
+    ).where(
+        literal_column(SEARCH_TABLE).op("MATCH")(match),
+        _search_index.c.rowid.between(first_rowid, last_rowid),
+        Transaction.user_id == user_id,
+        *[starts_a_word(word) for word in checked_words],
+        *filters
+    ).order_by(
+        score.desc(), Transaction.date.desc(), Transaction.id.desc()
+    ).limit(limit).offset(offset)
@@ -83,9 +83,24 @@ const api = {
         return response.json();
     },
 
-    // Get transactions
-    async getTransactions() {
-        const response = await fetch(`${API_URL}/api/transactions`, {
+    // Get upload job status
+    async getUploadJob(jobId) {
+        const response = await fetch(`${API_URL}/api/transactions/jobs/${jobId}`, {
+            headers: this.getHeaders()
+        });
+
+        if (!response.ok) throw new Error('Failed to get upload status');
+        return response.json();
+    },
+
+    // Get one page of transactions; pass the returned next_cursor as cursor for the next page
+    async getTransactions(filters = {}) {
+        const params = new URLSearchParams();
+        for (const [key, value] of Object.entries(filters)) {
+            if (value !== undefined && value !== null) params.set(key, value);
+        }
+        const query = params.toString() ? `?${params}` : '';
+        const response = await fetch(`${API_URL}/api/transactions${query}`, {
             headers: this.getHeaders()
         });
 
@@ -113,9 +128,13 @@ const api = {
         return response.json();
     },
 
-    // Get forecast
-    async getForecast() {
-        const response = await fetch(`${API_URL}/api/transactions/forecast`, {
+    // Get forecast, optionally windowed to historyDays and downsampled to points
+    async getForecast({ historyDays, points } = {}) {
+        const params = new URLSearchParams();
+        if (historyDays !== undefined) params.set('history_days', historyDays);
+        if (points !== undefined) params.set('points', points);
+        const query = params.toString() ? `?${params}` : '';
+        const response = await fetch(`${API_URL}/api/transactions/forecast${query}`, {
             headers: this.getHeaders()
         });
 
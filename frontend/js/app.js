@@ -40,7 +40,12 @@ async function loadDashboardData() {
         await loadSubscriptions();
 
         // Load forecast
-        const forecast = await api.getForecast();
+        // One point per ~2px of chart width, last year of history
+        const chartWidth = document.getElementById('balanceChart').getBoundingClientRect().width;
+        const forecast = await api.getForecast({
+            historyDays: 365,
+            points: Math.max(50, Math.round(chartWidth / 2))
+        });
         createBalanceForecastChart(forecast);
 
         // Load notifications
@@ -68,7 +73,7 @@ async function loadSubscriptions() {
             <div class="subscription-item">
                 <div class="subscription-info">
                     <h3>${sub.name}</h3>
-                    <p>${sub.frequency} • ${(sub.confidence_score * 100).toFixed(0)}% confidence</p>
+                    <p>${sub.frequency.replace(/_/g, ' ')} • ${(sub.confidence_score * 100).toFixed(0)}% confidence</p>
                 </div>
                 <div class="subscription-amount">₹${Math.round(sub.amount).toLocaleString('en-IN')}</div>
             </div>
@@ -202,11 +207,23 @@ async function handleFileUpload(file) {
     const statusDiv = document.getElementById('uploadStatus');
 
     try {
-        showUploadStatus('Uploading and analyzing...', 'loading');
+        showUploadStatus('Uploading...', 'loading');
 
-        const result = await api.uploadTransactions(file);
+        let job = await api.uploadTransactions(file);
 
-        showUploadStatus(`✅ Successfully processed ${result.transactions_count} transactions!`, 'success');
+        // Processing runs in the background; poll until the job finishes
+        while (job.status === 'queued' || job.status === 'running') {
+            const stage = job.stage === 'detecting' ? 'Detecting subscriptions' : 'Processing';
+            showUploadStatus(`${stage}... ${Math.round(job.progress * 100)}%`, 'loading');
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            job = await api.getUploadJob(job.id);
+        }
+
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Upload failed');
+        }
+
+        showUploadStatus(`✅ Successfully processed ${job.transactions_count} transactions!`, 'success');
 
         // Reload dashboard data
         setTimeout(() => {